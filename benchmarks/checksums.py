@@ -0,0 +1,70 @@
+"""
+Benchmark the checksum engine against the original 4 KiB sha512 read loop.
+
+Run from the repository root:
+    python benchmarks/checksums.py --size_mb 2048
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from emit_utils.checksums import calc_checksums
+
+
+def legacy_checksum(path):
+    """The original calc_checksum - sha512 over 4 KiB reads"""
+    h = hashlib.sha512()
+    with open(path, "rb") as f:
+        for byte_block in iter(lambda: f.read(4096), b""):
+            h.update(byte_block)
+    return h.hexdigest()
+
+
+def make_file(path, size_mb):
+    rng = np.random.default_rng(0)
+    with open(path, 'wb') as fout:
+        for _ in range(int(size_mb)):
+            fout.write(rng.bytes(1024**2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark checksum throughput')
+    parser.add_argument('--size_mb', type=int, default=1024)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--algorithms', type=str, nargs='+', default=['sha512', 'md5'])
+    parser.add_argument('--buffer_sizes_mb', type=float, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--tmp_dir', type=str, default=None, help='Directory for scratch files')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        path = os.path.join(tmp_dir, 'checksum_input.bin')
+        make_file(path, args.size_mb)
+        print(f'{args.size_mb} MB file (warm page cache - results reflect hashing and read overhead, not disk)')
+
+        times = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            reference = legacy_checksum(path)
+            times.append(time.perf_counter() - start)
+        print(f'{"legacy 4 KiB sha512":>36}: {args.size_mb / min(times):8.0f} MB/s')
+
+        for method in ['readinto', 'mmap']:
+            for buffer_mb in args.buffer_sizes_mb:
+                for algorithms in [['sha512'], args.algorithms]:
+                    rates = []
+                    for _ in range(args.repeats):
+                        checksums, stats = calc_checksums(path, algorithms, buffer_size=int(buffer_mb * 1024**2),
+                                                          method=method)
+                        rates.append(stats['bytes_per_second'] / 1024**2)
+                    if checksums['sha512'] != reference:
+                        raise RuntimeError(f'sha512 mismatch for {method}, {buffer_mb} MB buffer')
+                    label = f'{method} {buffer_mb:g} MB {"+".join(algorithms)}'
+                    print(f'{label:>36}: {max(rates):8.0f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
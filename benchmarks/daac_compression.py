@@ -0,0 +1,111 @@
+"""
+Benchmark daac_converter compression profiles - write time, read time and file size - on synthetic EMIT-shaped
+location, GLT and reflectance arrays.  The filters column shows what the installed netCDF4 actually applied to
+reflectance: shuffle is only used with zlib, so zstd runs without it.
+
+Run from the repository root:
+    python benchmarks/daac_compression.py --lines 1280 --samples 1242 --bands 285
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import netCDF4
+import numpy as np
+
+from emit_utils import daac_converter
+
+
+def make_synthetic_arrays(lines, samples, bands, seed=0):
+    """Smooth lon / lat / elev, a GLT-like integer lookup, and a noisy reflectance cube"""
+    rng = np.random.default_rng(seed)
+    row = np.arange(lines)[:, np.newaxis]
+    col = np.arange(samples)[np.newaxis, :]
+    arrays = {}
+    arrays['lon'] = (-110 + 0.0006 * col + 0.0002 * row).astype(np.float64)
+    arrays['lat'] = (35 - 0.0006 * row + 0.0001 * col).astype(np.float64)
+    arrays['elev'] = (1200 + 300 * np.sin(row / 90.) * np.cos(col / 70.) + rng.normal(0, 2, (lines, samples)))
+    glt = (col + row * 3) % samples + 1
+    glt[rng.random((lines, samples)) < 0.3] = 0
+    arrays['glt_x'] = glt.astype(np.int32)
+    spectrum = 0.2 + 0.1 * np.sin(np.linspace(0, 6, bands))
+    arrays['reflectance'] = (spectrum[np.newaxis, np.newaxis, :] +
+                             rng.normal(0, 0.01, (lines, samples, bands))).astype(np.float32)
+    return arrays
+
+
+def write_profile(path, arrays, profile, max_memory_mb):
+    nc_ds = netCDF4.Dataset(path, 'w', format='NETCDF4')
+    lines, samples, bands = arrays['reflectance'].shape
+    nc_ds.createDimension('downtrack', lines)
+    nc_ds.createDimension('crosstrack', samples)
+    nc_ds.createDimension('bands', bands)
+    with daac_converter.write_session(nc_ds):
+        for name in ['lon', 'lat', 'elev']:
+            daac_converter.add_variable(nc_ds, f'location/{name}', 'd', None, None, arrays[name],
+                                        {'dimensions': ('downtrack', 'crosstrack')}, profile=profile,
+                                        max_memory_mb=max_memory_mb)
+        daac_converter.add_variable(nc_ds, 'location/glt_x', 'i4', None, None, arrays['glt_x'],
+                                    {'dimensions': ('downtrack', 'crosstrack')}, fill_value=0, profile=profile,
+                                    max_memory_mb=max_memory_mb)
+        daac_converter.add_variable(nc_ds, 'reflectance', 'f4', None, None, arrays['reflectance'],
+                                    {'dimensions': ('downtrack', 'crosstrack', 'bands')}, profile=profile,
+                                    max_memory_mb=max_memory_mb)
+    nc_ds.close()
+
+
+def applied_filters(path):
+    """Codec, level and shuffle as recorded on the reflectance variable, e.g. zlib1+shuffle"""
+    nc_ds = netCDF4.Dataset(path, 'r')
+    filters = nc_ds['reflectance'].filters() or {}
+    nc_ds.close()
+    codecs = [c for c in ['zlib', 'zstd', 'szip', 'bzip2', 'blosc'] if filters.get(c)]
+    if len(codecs) == 0:
+        return 'none'
+    return f'{codecs[0]}{filters.get("complevel", "")}' + ('+shuffle' if filters.get('shuffle') else '')
+
+
+def read_all(path):
+    nc_ds = netCDF4.Dataset(path, 'r')
+    for name in ['location/lon', 'location/lat', 'location/elev', 'location/glt_x', 'reflectance']:
+        nc_ds[name][:]
+    nc_ds.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark daac_converter compression profiles')
+    parser.add_argument('--lines', type=int, default=1280)
+    parser.add_argument('--samples', type=int, default=1242)
+    parser.add_argument('--bands', type=int, default=285)
+    parser.add_argument('--profiles', type=str, nargs='+', default=list(daac_converter.COMPRESSION_PROFILES.keys()))
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--max_memory_mb', type=float, default=512)
+    parser.add_argument('--tmp_dir', type=str, default=None, help='Directory for scratch files')
+    args = parser.parse_args()
+
+    arrays = make_synthetic_arrays(args.lines, args.samples, args.bands)
+    raw_mb = sum([a.nbytes for a in arrays.values()]) / 1024**2
+    print(f'Synthetic granule: {args.lines} x {args.samples} x {args.bands}, {raw_mb:.0f} MB uncompressed')
+    print(f'{"profile":>14} {"filters":>16} {"write s":>9} {"read s":>9} {"size MB":>9} {"ratio":>7}')
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        for profile in args.profiles:
+            path = os.path.join(tmp_dir, f'{profile}.nc')
+            write_times, read_times = [], []
+            for _ in range(args.repeats):
+                if os.path.exists(path):
+                    os.remove(path)
+                start = time.perf_counter()
+                write_profile(path, arrays, profile, args.max_memory_mb)
+                write_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                read_all(path)
+                read_times.append(time.perf_counter() - start)
+            size_mb = os.path.getsize(path) / 1024**2
+            print(f'{profile:>14} {applied_filters(path):>16} {min(write_times):9.2f} {min(read_times):9.2f} {size_mb:9.1f} {raw_mb / size_mb:7.2f}')
+
+
+if __name__ == '__main__':
+    main()
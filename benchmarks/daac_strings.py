@@ -0,0 +1,59 @@
+"""
+Microbenchmark daac_converter.add_variable string writes - bulk variable length and fixed width strings - against
+writing one element per call.
+
+Run from the repository root:
+    python benchmarks/daac_strings.py --count 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import netCDF4
+
+from emit_utils import daac_converter
+
+
+def write_strings(path, strings, mode):
+    nc_ds = netCDF4.Dataset(path, 'w', format='NETCDF4')
+    nc_ds.createDimension('names', len(strings))
+    nc_ds.createDimension('name_length', max([len(s) for s in strings]))
+    start = time.perf_counter()
+    if mode == 'per element':
+        nc_var = nc_ds.createVariable('names', str, ('names',))
+        for _n in range(len(strings)):
+            nc_var[_n] = strings[_n]
+    elif mode == 'bulk str':
+        daac_converter.add_variable(nc_ds, 'names', str, None, None, strings, {'dimensions': ('names',)},
+                                    fill_value=None)
+    elif mode == 'bulk S1':
+        daac_converter.add_variable(nc_ds, 'names', 'S1', None, None, strings,
+                                    {'dimensions': ('names', 'name_length')}, fill_value=None)
+    elapsed = time.perf_counter() - start
+    nc_ds.close()
+
+    nc_ds = netCDF4.Dataset(path, 'r')
+    if list(nc_ds['names'][:]) != list(strings):
+        raise RuntimeError(f'{mode} strings did not round trip')
+    nc_ds.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark add_variable string writes')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--tmp_dir', type=str, default=None, help='Directory for scratch files')
+    args = parser.parse_args()
+
+    strings = [f'Observation {_n} band name' for _n in range(args.count)]
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        path = os.path.join(tmp_dir, 'strings.nc')
+        for mode in ['per element', 'bulk str', 'bulk S1']:
+            best = min([write_strings(path, strings, mode) for _ in range(args.repeats)])
+            print(f'{mode:>12}: {best * 1e3:8.2f} ms, {best / args.count * 1e6:6.2f} us / string')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark reformat ENVI write throughput for each output interleave on a synthetic EMIT-shaped netCDF.
+
+Run from the repository root:
+    python benchmarks/reformat_interleave.py --lines 1280 --samples 1242 --bands 285
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import netCDF4
+import numpy as np
+
+from emit_utils import reformat
+
+
+def make_synthetic_netcdf(path, lines, samples, bands, chunk_lines=64):
+    """Write a chunked, uncompressed (downtrack, crosstrack, bands) float32 variable, mimicking EMIT L1B/L2A"""
+    nc_ds = netCDF4.Dataset(path, 'w', format='NETCDF4')
+    nc_ds.createDimension('downtrack', lines)
+    nc_ds.createDimension('crosstrack', samples)
+    nc_ds.createDimension('bands', bands)
+    nc_var = nc_ds.createVariable('reflectance', 'f4', ('downtrack', 'crosstrack', 'bands'),
+                                  chunksizes=(chunk_lines, samples, bands), fill_value=-9999.)
+    rng = np.random.default_rng(0)
+    for start in range(0, lines, chunk_lines):
+        stop = min(start + chunk_lines, lines)
+        nc_var[start:stop, ...] = rng.random((stop - start, samples, bands), dtype=np.float32)
+    nc_ds.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark reformat ENVI write throughput by interleave')
+    parser.add_argument('--lines', type=int, default=1280)
+    parser.add_argument('--samples', type=int, default=1242)
+    parser.add_argument('--bands', type=int, default=285)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--max_memory_mb', type=float, default=512)
+    parser.add_argument('--tmp_dir', type=str, default=None, help='Directory for scratch files')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        input_netcdf = os.path.join(tmp_dir, 'synthetic.nc')
+        make_synthetic_netcdf(input_netcdf, args.lines, args.samples, args.bands)
+        size_mb = args.lines * args.samples * args.bands * 4 / 1024**2
+        print(f'Synthetic cube: {args.lines} x {args.samples} x {args.bands} float32 ({size_mb:.0f} MB)')
+
+        for interleave in ['BIP', 'BIL', 'BSQ']:
+            times = []
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                reformat.main([input_netcdf, tmp_dir, '--interleave', interleave, '--overwrite',
+                               '--max_memory_mb', str(args.max_memory_mb)])
+                times.append(time.perf_counter() - start)
+            best = min(times)
+            print(f'{interleave}: best {best:.2f} s, {size_mb / best:.0f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark the block-parallel SceneStats against the original full-scene file_checks statistics, on a synthetic
+EMIT-sized scene, and check that every statistic is bit-identical.
+
+Run from the repository root:
+    python benchmarks/scene_stats.py --threads 1 2 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from spectral.io import envi
+
+from emit_utils import file_checks
+from emit_utils.file_checks import (MASK_AOD_BAND, MASK_AGGREGATE_BAND, MASK_WATER_VAPOR_BAND,
+                                    OBS_SOLAR_AZIMUTH_BAND, OBS_SOLAR_ZENITH_BAND, envi_header)
+
+
+def legacy_cloudfraction(mask_file, mask_band=MASK_AGGREGATE_BAND):
+    """The original check_cloudfraction"""
+    clouds = envi.open(envi_header(mask_file)).open_memmap(interleave='bip')[..., mask_band]
+    fraction = np.sum(clouds > 0) * 100 / np.prod(clouds.shape)
+    return int(np.round(fraction))
+
+
+def legacy_nodatafraction(input_file, band=0, no_data_value=-9999):
+    """The original check_nodatafraction"""
+    data = envi.open(envi_header(input_file)).open_memmap(interleave='bip')[..., band]
+    fraction = np.sum(data == no_data_value) * 100 / np.prod(data.shape)
+    return int(np.round(fraction))
+
+
+def legacy_zenith_percentiles(obs_file, zenith_band=OBS_SOLAR_ZENITH_BAND):
+    """The percentiles of the original check_daynight"""
+    zenith = envi.open(envi_header(obs_file)).open_memmap(interleave='bip')[..., zenith_band]
+    return [np.percentile(zenith[zenith != -9999], 2), np.percentile(zenith[zenith != -9999], 98)]
+
+
+def legacy_band_mean(input_file, band):
+    """The original get_band_mean"""
+    target = envi.open(envi_header(input_file)).open_memmap(interleave='bip')[..., band]
+    good = target > -9990
+    return np.mean(target[good])
+
+
+def legacy_all(obs_file, mask_file):
+    return {'cloud_fraction': legacy_cloudfraction(mask_file),
+            'nodata_fraction': legacy_nodatafraction(obs_file),
+            'zenith_percentiles': legacy_zenith_percentiles(obs_file),
+            'solar_zenith': legacy_band_mean(obs_file, OBS_SOLAR_ZENITH_BAND),
+            'solar_azimuth': legacy_band_mean(obs_file, OBS_SOLAR_AZIMUTH_BAND),
+            'water_vapor': legacy_band_mean(mask_file, MASK_WATER_VAPOR_BAND),
+            'aod': legacy_band_mean(mask_file, MASK_AOD_BAND)}
+
+
+def scene_stats_all(obs_file, mask_file, n_threads):
+    obs = file_checks.SceneStats(obs_file, [
+        file_checks.StatRequest('nodata_fraction', 0, 'fraction_equal', -9999),
+        file_checks.StatRequest('zenith_percentiles', OBS_SOLAR_ZENITH_BAND, 'percentile', [2, 98], nodata=-9999),
+        file_checks.StatRequest('solar_zenith', OBS_SOLAR_ZENITH_BAND, 'mean', valid_min=-9990),
+        file_checks.StatRequest('solar_azimuth', OBS_SOLAR_AZIMUTH_BAND, 'mean', valid_min=-9990)],
+        n_threads=n_threads).compute()
+    mask = file_checks.SceneStats(mask_file, [
+        file_checks.StatRequest('cloud_fraction', MASK_AGGREGATE_BAND, 'fraction_above', 0),
+        file_checks.StatRequest('water_vapor', MASK_WATER_VAPOR_BAND, 'mean', valid_min=-9990),
+        file_checks.StatRequest('aod', MASK_AOD_BAND, 'mean', valid_min=-9990)],
+        n_threads=n_threads).compute()
+    obs.update(mask)
+    obs['cloud_fraction'] = int(np.round(obs['cloud_fraction']))
+    obs['nodata_fraction'] = int(np.round(obs['nodata_fraction']))
+    return obs
+
+
+def make_scene(path, lines, samples, bands, interleave, seed, byte_order=0):
+    """Synthetic float32 scene with a -9999 border and a few scattered nodata pixels, little (byte order = 0) or
+    big (byte order = 1) endian"""
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(0, 120, size=(lines, samples, bands)).astype(np.float32)
+    data[:, :40, :] = -9999
+    data[:, -25:, :] = -9999
+    data[rng.random((lines, samples)) < 0.01, :] = -9999
+    data[..., bands - 1] = np.where(rng.random((lines, samples)) < 0.3, 1, 0)
+    axes = {'bip': (0, 1, 2), 'bil': (0, 2, 1), 'bsq': (2, 0, 1)}[interleave]
+    np.ascontiguousarray(data.transpose(axes)).astype(['<f4', '>f4'][byte_order]).tofile(path)
+    with open(path + '.hdr', 'w') as fout:
+        fout.write(f'ENVI\nsamples = {samples}\nlines = {lines}\nbands = {bands}\nheader offset = 0\n'
+                   f'file type = ENVI Standard\ndata type = 4\ninterleave = {interleave}\nbyte order = {byte_order}\n')
+
+
+def best_time(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark file_checks scene statistics')
+    parser.add_argument('--lines', type=int, default=1280)
+    parser.add_argument('--samples', type=int, default=1242)
+    parser.add_argument('--interleave', type=str, nargs='+', default=['bil', 'bip', 'bsq'])
+    parser.add_argument('--byte_order', type=int, nargs='+', default=[0, 1], choices=[0, 1])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--tmp_dir', type=str, default=None, help='Directory for scratch files')
+    args = parser.parse_args()
+
+    print(f'{args.lines} x {args.samples} scene, 11-band obs and 8-band mask, cpu count {os.cpu_count()} '
+          f'(warm page cache)')
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as tmp_dir:
+        for byte_order in args.byte_order:
+            for interleave in args.interleave:
+                case = f'{interleave} {["le", "be"][byte_order]}'
+                obs_file = os.path.join(tmp_dir, f'obs_{interleave}_{byte_order}')
+                mask_file = os.path.join(tmp_dir, f'mask_{interleave}_{byte_order}')
+                make_scene(obs_file, args.lines, args.samples, 11, interleave, 0, byte_order)
+                make_scene(mask_file, args.lines, args.samples, 8, interleave, 1, byte_order)
+
+                legacy_time, reference = best_time(lambda: legacy_all(obs_file, mask_file), args.repeats)
+                print(f'{case} {"original functions":>24}: {legacy_time * 1000:8.1f} ms')
+                for n_threads in args.threads:
+                    elapsed, result = best_time(lambda: scene_stats_all(obs_file, mask_file, n_threads),
+                                                args.repeats)
+                    for key, value in reference.items():
+                        if not np.array_equal(result[key], value):
+                            raise RuntimeError(f'{key} differs for {case} with {n_threads} threads: '
+                                               f'{result[key]} != {value}')
+                    label = f'SceneStats {n_threads} threads'
+                    print(f'{case} {label:>24}: {elapsed * 1000:8.1f} ms  ({legacy_time / elapsed:.1f}x, '
+                          f'identical)')
+
+if __name__ == '__main__':
+    main()
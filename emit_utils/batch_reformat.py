@@ -0,0 +1,188 @@
+"""
+Reformat many EMIT netCDFs in one invocation, sharing a single worker pool across granules.
+
+Any arguments not listed below are passed through to reformat for every granule, e.g.:
+    python emit_utils/batch_reformat.py OUTPUT_DIR --inputs '/data/*/EMIT_L2A_RFL_*.nc' --workers 32 --orthorectify
+"""
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import netCDF4
+
+from emit_utils import reformat
+
+
+# per-process cache of open granules, populated by _get_granule
+_worker_granules = {}
+_max_open_granules = 4
+
+
+def _granule_args(input_netcdf, output_dir, reformat_args, glt_cache_dir):
+    args = reformat.build_parser().parse_args([input_netcdf, output_dir] + reformat_args)
+    if args.orthorectify:
+        base = os.path.splitext(os.path.basename(input_netcdf))[0]
+        args.glt_cache = os.path.join(glt_cache_dir, base + '_glt_index.npy')
+    # parallelism comes from the batch pool
+    args.workers = 1
+    args.threads = '1'
+    return args
+
+
+def _get_granule(args):
+    if args.input_netcdf not in _worker_granules:
+        if len(_worker_granules) >= _max_open_granules:
+            oldest = next(iter(_worker_granules))
+            _worker_granules.pop(oldest)[0].close()
+        nc_ds = netCDF4.Dataset(args.input_netcdf, 'r', format='NETCDF4')
+        glt_index = None
+        if args.orthorectify:
+            glt_index = reformat.GltIndex.from_netcdf(nc_ds, cache_file=args.glt_cache, bbox=args.window)
+        _worker_granules[args.input_netcdf] = (nc_ds, glt_index)
+    return _worker_granules[args.input_netcdf]
+
+
+def _plan_granule(args):
+    start = time.perf_counter()
+    try:
+        nc_ds = netCDF4.Dataset(args.input_netcdf, 'r', format='NETCDF4')
+        dataset_names = reformat.select_variables(nc_ds, args)
+        if args.orthorectify:
+            # builds (or validates) the GLT cache that the variable tasks load from
+            reformat.GltIndex.from_netcdf(nc_ds, cache_file=args.glt_cache)
+        nc_ds.close()
+    except Exception:
+        return args.input_netcdf, None, traceback.format_exc(), time.perf_counter() - start
+    return args.input_netcdf, dataset_names, None, time.perf_counter() - start
+
+
+def _export_task(args, ds):
+    start = time.perf_counter()
+    try:
+        nc_ds, glt_index = _get_granule(args)
+        reformat.export(nc_ds, ds, args, glt_index=glt_index)
+    except Exception:
+        return args.input_netcdf, ds, traceback.format_exc(), time.perf_counter() - start
+    return args.input_netcdf, ds, None, time.perf_counter() - start
+
+
+def find_inputs(inputs=None, manifest=None):
+    """Collect the netCDFs to reformat from glob patterns and / or a manifest
+
+    Args:
+        inputs (list, optional): paths or glob patterns
+        manifest (str, optional): text file with one path or glob pattern per line (# for comments)
+
+    Returns:
+        list: sorted, unique input paths
+    """
+    patterns = list(inputs) if inputs is not None else []
+    if manifest is not None:
+        with open(manifest, 'r') as fin:
+            patterns.extend([line.strip() for line in fin if line.strip() and not line.strip().startswith('#')])
+
+    input_files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern)
+        if len(matches) == 0:
+            logging.warning(f'No files match {pattern}')
+        input_files.extend(matches)
+    return sorted(set(input_files))
+
+
+def batch_reformat(input_files, output_dir, reformat_args, workers=1, glt_cache_dir=None):
+    """Reformat many granules on one process pool, scheduling one task per granule and variable.
+    Failures are recorded per granule and variable without stopping the rest of the batch.
+
+    Args:
+        input_files (list): netCDFs to reformat
+        output_dir (str): directory to write all outputs to
+        reformat_args (list): extra reformat command line arguments applied to every granule
+        workers (int, optional): number of worker processes. Defaults to 1.
+        glt_cache_dir (str, optional): directory for per-granule GLT index caches. Defaults to None, output_dir.
+
+    Returns:
+        dict: summary keyed by input file, with status, per-variable timings and errors
+    """
+    glt_cache_dir = output_dir if glt_cache_dir is None else glt_cache_dir
+    granule_args = {f: _granule_args(f, output_dir, reformat_args, glt_cache_dir) for f in input_files}
+    summary = {f: {'status': 'pending', 'plan_seconds': None, 'variables': {}, 'error': None} for f in input_files}
+
+    ctx = multiprocessing.get_context('spawn')
+    batch_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+        plan_futures = [executor.submit(_plan_granule, granule_args[f]) for f in input_files]
+        export_futures = []
+        for future in as_completed(plan_futures):
+            input_file, dataset_names, error, elapsed = future.result()
+            summary[input_file]['plan_seconds'] = elapsed
+            if error is not None:
+                summary[input_file]['status'] = 'failed'
+                summary[input_file]['error'] = error
+                logging.error(f'Failed to open {input_file}:\n{error}')
+                continue
+            for ds in dataset_names:
+                summary[input_file]['variables'][ds] = None
+                export_futures.append(executor.submit(_export_task, granule_args[input_file], ds))
+
+        for future in as_completed(export_futures):
+            input_file, ds, error, elapsed = future.result()
+            summary[input_file]['variables'][ds] = {'seconds': elapsed, 'error': error}
+            if error is not None:
+                logging.error(f'Failed to convert {ds} from {input_file}:\n{error}')
+
+    for input_file, granule in summary.items():
+        if granule['status'] == 'failed':
+            granule['seconds'] = granule['plan_seconds']
+            continue
+        failed = [ds for ds, result in granule['variables'].items() if result['error'] is not None]
+        granule['status'] = 'failed' if len(failed) > 0 else 'succeeded'
+        granule['seconds'] = granule['plan_seconds'] + sum([r['seconds'] for r in granule['variables'].values()])
+
+    logging.info(f'Reformatted {len(input_files)} granules in {time.perf_counter() - batch_start:.1f} s')
+    return summary
+
+
+def main(rawargs=None):
+    parser = argparse.ArgumentParser(description='Reformat many EMIT netCDFs with a shared worker pool.  '
+                                                 'Unrecognized arguments are passed through to reformat.')
+    parser.add_argument('output_dir', type=str, help='Base directory for output files')
+    parser.add_argument('--inputs', type=str, nargs='+', default=None, help='netCDF paths or glob patterns')
+    parser.add_argument('--manifest', type=str, default=None, help='Text file of netCDF paths or glob patterns, one per line')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--glt_cache_dir', type=str, default=None, help='Directory for GLT index caches (default output_dir)')
+    parser.add_argument('--summary', type=str, default=None, help='JSON summary output (default output_dir/batch_reformat_summary.json)')
+    parser.add_argument('--log_level', type=str, default='INFO', help='Logging level')
+    args, reformat_args = parser.parse_known_args(rawargs)
+    logging.basicConfig(format='%(levelname)s:%(asctime)s ||| %(message)s', level=args.log_level)
+
+    if os.path.isdir(args.output_dir) is False:
+        err_str = f'Output directory {args.output_dir} does not exist - please create or try again'
+        raise AttributeError(err_str)
+
+    input_files = find_inputs(args.inputs, args.manifest)
+    if len(input_files) == 0:
+        raise AttributeError('No input files found - check --inputs and --manifest')
+
+    summary = batch_reformat(input_files, args.output_dir, reformat_args, workers=args.workers,
+                             glt_cache_dir=args.glt_cache_dir)
+
+    summary_file = args.summary
+    if summary_file is None:
+        summary_file = os.path.join(args.output_dir, 'batch_reformat_summary.json')
+    with open(summary_file, 'w') as fout:
+        fout.write(json.dumps(summary, indent=2))
+
+    failed = [f for f, granule in summary.items() if granule['status'] != 'succeeded']
+    if len(failed) > 0:
+        raise RuntimeError(f'{len(failed)} of {len(input_files)} granules failed - see {summary_file} for details')
+
+
+if __name__ == "__main__":
+    main()
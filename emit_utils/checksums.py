@@ -0,0 +1,189 @@
+"""
+Checksum engine for large files - big reusable buffers, a zero-copy read path, and several hashlib algorithms
+computed in a single pass over the file.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BUFFER_SIZE = 8 * 1024**2
+
+# UMM-G Checksum Algorithm names for hashlib algorithms
+UMMG_ALGORITHM_NAMES = {
+    'md5': 'MD5',
+    'sha1': 'SHA-1',
+    'sha256': 'SHA-256',
+    'sha384': 'SHA-384',
+    'sha512': 'SHA-512',
+}
+
+
+def hashlib_name(algorithm: str):
+    """
+    Normalize an algorithm name (e.g. 'SHA-512' as used in UMM-G, or 'sha512') to its hashlib name
+    Args:
+        algorithm: algorithm name
+
+    Returns:
+        str: hashlib algorithm name
+    """
+    name = algorithm.lower().replace('-', '')
+    if name not in hashlib.algorithms_available:
+        raise AttributeError(f'Checksum algorithm {algorithm} is not available in hashlib')
+    return name
+
+
+class ChecksumCache:
+    """
+    Persistent SQLite cache of file checksums, keyed by path and algorithm and valid only while the file's size,
+    mtime_ns and inode are unchanged.  Safe to share between threads, and between processes via SQLite locking.
+    Args:
+        db_path: SQLite database file, created if needed
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('CREATE TABLE IF NOT EXISTS checksums (path TEXT, algorithm TEXT, size INTEGER, '
+                               'mtime_ns INTEGER, inode INTEGER, digest TEXT, PRIMARY KEY (path, algorithm))')
+
+    @staticmethod
+    def file_key(path: str):
+        """
+        Identity of a file for cache lookups
+        Args:
+            path: file path
+
+        Returns:
+            tuple: (real path, size, mtime_ns, inode)
+        """
+        st = os.stat(path)
+        return os.path.realpath(path), st.st_size, st.st_mtime_ns, st.st_ino
+
+    def get(self, file_key: tuple, algorithm: str):
+        """
+        Look up a cached digest
+        Args:
+            file_key: from file_key
+            algorithm: hashlib algorithm name
+
+        Returns:
+            str: hex digest, or None if not cached or the file has changed
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT size, mtime_ns, inode, digest FROM checksums WHERE path = ? AND algorithm = ?',
+                                     (file_key[0], algorithm)).fetchone()
+        if row is None or tuple(row[:3]) != tuple(file_key[1:]):
+            return None
+        return row[3]
+
+    def put(self, file_key: tuple, algorithm: str, digest: str):
+        """
+        Store a digest
+        Args:
+            file_key: from file_key, taken before the file was hashed
+            algorithm: hashlib algorithm name
+            digest: hex digest
+        """
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?, ?)',
+                               (file_key[0], algorithm) + tuple(file_key[1:]) + (digest,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _read_blocks(fin, buffer_size, method):
+    if method == 'mmap':
+        if os.fstat(fin.fileno()).st_size == 0:
+            return
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for start in range(0, len(mm), buffer_size):
+                    block = view[start:start + buffer_size]
+                    yield block
+                    block.release()
+            finally:
+                view.release()
+    elif method == 'readinto':
+        buffer = bytearray(buffer_size)
+        view = memoryview(buffer)
+        while True:
+            n_read = fin.readinto(buffer)
+            if n_read == 0:
+                break
+            yield view[:n_read]
+    else:
+        raise AttributeError(f'Unknown checksum read method {method}, options are readinto or mmap')
+
+
+def calc_checksums(path: str, algorithms=('sha512',), buffer_size: int = DEFAULT_BUFFER_SIZE,
+                   method: str = 'readinto', cache: ChecksumCache = None, verify: bool = False):
+    """
+    Compute one or more checksums of a file in a single read pass
+    Args:
+        path: file to checksum
+        algorithms: hashlib (or UMM-G style, e.g. 'SHA-512') algorithm names
+        buffer_size: read size in bytes
+        method: 'readinto' to read into one reused buffer, or 'mmap' to hash a memory map of the file directly
+        cache: optional ChecksumCache - the file is only read if a digest is missing or the file has changed
+        verify: if True, rehash even when cached, warn if the cached digest was wrong, and update the cache
+
+    Returns:
+        dict: hex digests keyed by the algorithm names as given
+        dict: read statistics - bytes, seconds, bytes_per_second, and cached (True if no bytes were read)
+    """
+    algorithms = list(algorithms)
+    hashes = {algorithm: hashlib.new(hashlib_name(algorithm)) for algorithm in algorithms}
+
+    cached = {}
+    if cache is not None:
+        file_key = cache.file_key(path)
+        cached = {algorithm: cache.get(file_key, hashlib_name(algorithm)) for algorithm in algorithms}
+        if verify is False and None not in cached.values():
+            return cached, {'bytes': 0, 'seconds': 0., 'bytes_per_second': 0., 'cached': True}
+
+    start_time = time.perf_counter()
+    n_bytes = 0
+    # hashlib releases the GIL on large updates, so multiple algorithms hash each block concurrently
+    with ThreadPoolExecutor(max_workers=len(hashes)) as executor, open(path, 'rb', buffering=0) as fin:
+        for block in _read_blocks(fin, buffer_size, method):
+            if len(hashes) == 1:
+                hashes[algorithms[0]].update(block)
+            else:
+                list(executor.map(lambda h: h.update(block), hashes.values()))
+            n_bytes += len(block)
+    elapsed = time.perf_counter() - start_time
+
+    stats = {'bytes': n_bytes, 'seconds': elapsed,
+             'bytes_per_second': n_bytes / elapsed if elapsed > 0 else float('inf'), 'cached': False}
+    logging.debug(f'Checksummed {path} ({", ".join(hashes.keys())}): {n_bytes} bytes in {elapsed:.3f} s, '
+                  f'{stats["bytes_per_second"] / 1024**2:.0f} MB/s')
+    checksums = {algorithm: h.hexdigest() for algorithm, h in hashes.items()}
+
+    if cache is not None:
+        for algorithm, digest in checksums.items():
+            if cached.get(algorithm) is not None and cached[algorithm] != digest:
+                logging.warning(f'Cached {algorithm} checksum for {path} did not match its contents - updating cache')
+        # only cache if the file did not change while it was being read
+        if cache.file_key(path) == file_key:
+            for algorithm, digest in checksums.items():
+                cache.put(file_key, hashlib_name(algorithm), digest)
+    return checksums, stats
@@ -36,21 +36,116 @@ X CloudCover - L2A PGE adds to cloudcover percentage to database from mask (phil
 X NativeProjectionNames
 """
 
-import hashlib
+import logging
 import netCDF4
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from osgeo import gdal, osr
-from spectral.io import envi
+from osgeo import osr
 from typing import List
 import json
 import numpy as np
 
+from emit_utils.dataset_cache import open_envi, open_memmap, probe_raster
+from emit_utils.checksums import DEFAULT_BUFFER_SIZE, ChecksumCache, calc_checksums
 from emit_utils.file_checks import envi_header
+from emit_utils.footprint import glt_footprint
+from emit_utils.ummg_schema import UMMG_URL, UMMG_VERSION, validate_ummg
 
 NODATA = -9999.
 
+# Named compression / chunking profiles for add_variable, add_loc and add_glt.  Explicit createVariable
+# arguments passed in kargs always take precedence.  chunk_lines sets the downtrack chunk size, with other
+# dimensions kept whole.  zstd is much faster to write but readers need the HDF5 zstd plugin, so it is opt-in;
+# if the filter is not available in the installed netCDF4 / HDF5 the profile falls back.  netCDF4 only applies
+# shuffle together with zlib, so the zstd profile has none - it is not a like-for-like codec swap.
+# Measure with benchmarks/daac_compression.py.
+COMPRESSION_PROFILES = {
+    'none': {},
+    'fast': {'compression': 'zlib', 'complevel': 1, 'shuffle': True, 'chunk_lines': 64},
+    'archive': {'compression': 'zlib', 'complevel': 9, 'shuffle': True, 'chunk_lines': 64},
+    'zstd': {'compression': 'zstd', 'complevel': 3, 'chunk_lines': 64, 'fallback': 'fast'},
+}
+
+
+def _filter_available(nc_ds, compression):
+    if compression in [None, 'zlib']:
+        return True
+    has_filter = getattr(nc_ds, f'has_{compression}_filter', None)
+    return has_filter is not None and has_filter()
+
+
+def profile_kargs(nc_ds, kargs, profile):
+    """
+    Merge a named compression / chunking profile into createVariable arguments
+    Args:
+        nc_ds: output netcdf dataset the variable will be created in
+        kargs: createVariable arguments; explicit compression or chunksizes entries win over the profile
+        profile: key of COMPRESSION_PROFILES, or None to use kargs unchanged
+
+    Returns:
+        dict: new createVariable arguments
+    """
+    kargs = dict(kargs)
+    if profile is None:
+        return kargs
+    if profile not in COMPRESSION_PROFILES:
+        raise AttributeError(f'Unknown compression profile {profile}, options are {list(COMPRESSION_PROFILES.keys())}')
+
+    settings = COMPRESSION_PROFILES[profile]
+    while not _filter_available(nc_ds, settings.get('compression')):
+        logging.warning(f'{settings["compression"]} filter not available, falling back to profile {settings["fallback"]}')
+        settings = COMPRESSION_PROFILES[settings['fallback']]
+
+    if 'zlib' not in kargs and 'compression' not in kargs:
+        for key in ['compression', 'complevel', 'shuffle']:
+            if key in settings:
+                kargs[key] = settings[key]
+
+    dimensions = kargs.get('dimensions', ())
+    if settings.get('chunk_lines') is not None and 'chunksizes' not in kargs and 'contiguous' not in kargs \
+            and len(dimensions) > 0 and all([d in nc_ds.dimensions for d in dimensions]):
+        shape = [len(nc_ds.dimensions[d]) for d in dimensions]
+        kargs['chunksizes'] = tuple([max(1, min(settings['chunk_lines'], shape[0]))] + shape[1:])
+    return kargs
+
+
+# open write sessions, keyed by id(nc_ds) - see write_session
+_write_sessions = {}
+
+
+@contextmanager
+def write_session(nc_ds: netCDF4.Dataset, sync_each: bool = False):
+    """
+    Batch writes to a netcdf output, flushing once when the session ends rather than after every
+    add_variable / add_loc / add_glt / makeDims / makeGlobalAttr call.  Nested sessions on the same
+    dataset join the outermost one.
+    Args:
+        nc_ds: output netcdf dataset to modify (mutable)
+        sync_each: if True, keep syncing after every call for crash-safety
+
+    Returns:
+    """
+    if id(nc_ds) in _write_sessions:
+        yield nc_ds
+        return
+
+    _write_sessions[id(nc_ds)] = sync_each
+    try:
+        yield nc_ds
+    finally:
+        del _write_sessions[id(nc_ds)]
+        if nc_ds.isopen():
+            nc_ds.sync()
+
+
+def _sync(nc_ds):
+    if _write_sessions.get(id(nc_ds), True):
+        nc_ds.sync()
+
+
 def _get_spatial_extent_res(path, projection_epsg=4326):
     """
     Get the spatial extent of a dataset, converted to a specified projection
@@ -58,30 +153,94 @@ def _get_spatial_extent_res(path, projection_epsg=4326):
         path: path of file to get extent from, assumes this is projected
         projection_epsg: epsg number of the projection of the output extent
     Returns:
-        List: extent of image in format [upper left x, upper left y, lower left x, lower left y]
+        List: extent of image in format [upper left x, upper left y, lower right x, lower right y], bounding all
+              four (possibly rotated) corners
         float: ground sampling distances
     """
-    ds = gdal.Open(path)
-    trans = ds.GetGeoTransform()
+    probe = probe_raster(path)
+    trans = probe.geotransform
 
-    ul = [trans[0], trans[3]]
-    lr = [trans[0] + trans[1] * ds.RasterXSize, trans[3] + trans[5] * ds.RasterYSize]
+    corners = []
+    for col, row in [(0, 0), (probe.x_size, 0), (0, probe.y_size), (probe.x_size, probe.y_size)]:
+        corners.append([trans[0] + trans[1] * col + trans[2] * row, trans[3] + trans[4] * col + trans[5] * row])
     srs = osr.SpatialReference()
-    srs.ImportFromWkt(ds.GetProjection())
+    srs.ImportFromWkt(probe.projection)
+    srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
 
     dst = osr.SpatialReference()
     dst.ImportFromEPSG(projection_epsg)
+    dst.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
     transformer = osr.CoordinateTransformation(srs, dst)
+    corners = np.array(transformer.TransformPoints(corners))
 
-    output_extent = [0,0,0,0]
-    output_extent[0], output_extent[1], _ = transformer.TransformPoint(*ul)
-    output_extent[2], output_extent[3], _ = transformer.TransformPoint(*lr)
+    output_extent = [np.min(corners[:, 0]), np.max(corners[:, 1]), np.max(corners[:, 0]), np.min(corners[:, 1])]
 
     return output_extent, trans[1]
 
 
-def add_variable(nc_ds, nc_name, data_type, long_name, units, data, kargs, fill_value = -9999.):
-    
+def _slab_lines(nc_var, max_memory_mb=512):
+    line_bytes = int(np.prod(nc_var.shape[1:])) * np.dtype(nc_var.dtype).itemsize
+    lines = max(1, int(max_memory_mb * 1024**2 // max(line_bytes, 1)))
+    chunksizes = nc_var.chunking()
+    if chunksizes != 'contiguous':
+        # keep slab edges on chunk boundaries so each chunk is compressed once
+        lines = max(chunksizes[0], lines // chunksizes[0] * chunksizes[0])
+    return lines
+
+
+def _write_slabs(nc_var, data, slab_lines):
+    # a variable on an unlimited first dimension has no rows until it is written, so size from the data
+    unlimited = nc_var.ndim > 0 and nc_var.get_dims()[0].isunlimited()
+    if callable(data):
+        if unlimited:
+            raise AttributeError(f'Cannot size {nc_var.name} from a callable along unlimited dimension '
+                                 f'{nc_var.dimensions[0]} - pass an array or an iterator of slabs')
+        for start in range(0, nc_var.shape[0], slab_lines):
+            stop = min(start + slab_lines, nc_var.shape[0])
+            nc_var[start:stop, ...] = data(start, stop)
+    elif hasattr(data, '__next__'):
+        start = 0
+        for slab in data:
+            nc_var[start:start + len(slab), ...] = slab
+            start += len(slab)
+        if not unlimited and start != nc_var.shape[0]:
+            raise AttributeError(f'Slabs for {nc_var.name} covered {start} of {nc_var.shape[0]} lines')
+    elif nc_var.ndim == 0 or np.ndim(data) == 0:
+        nc_var[...] = data
+    else:
+        n_lines = len(data) if unlimited else nc_var.shape[0]
+        for start in range(0, n_lines, slab_lines):
+            stop = min(start + slab_lines, n_lines)
+            nc_var[start:stop, ...] = np.asarray(data[start:stop])
+
+
+def add_variable(nc_ds, nc_name, data_type, long_name, units, data, kargs, fill_value = -9999., max_memory_mb = 512,
+                 profile = None):
+    """
+    Add a variable to the netcdf output, streaming numeric data in downtrack (first dimension) slabs
+    Args:
+        nc_ds: output netcdf dataset to modify (mutable)
+        nc_name: name of the variable, including any group path
+        data_type: netcdf data type, str for variable length strings, or "S1" for fixed width strings (with the
+                   string length as the last dimension in kargs)
+        long_name: long_name attribute, or None
+        units: units attribute, or None
+        data: data to write - an array (including an ENVI memmap or a strided view of one), an iterator of
+              slabs along the first dimension, a callable (start, stop) returning rows start:stop, or None to
+              only create the variable
+        kargs: extra arguments to createVariable (dimensions, chunksizes, compression...)
+        fill_value: fill value for the variable
+        max_memory_mb: approximate memory budget per slab in MB.  Slabs are aligned to the variable's chunks.
+        profile: compression / chunking profile from COMPRESSION_PROFILES, or None for kargs as given.
+                 Ignored for variable length strings, which HDF5 cannot compress.  String data is written in one call.
+
+    Returns:
+        netCDF4.Variable: the new variable
+    """
+
+    if data_type is not str:
+        kargs = profile_kargs(nc_ds, kargs, profile)
+
     if data_type == "u1":
         kargs['fill_value'] = np.uint8(np.mod(int(NODATA), 2**8))
     elif data_type == "u4":
@@ -95,54 +254,102 @@ def add_variable(nc_ds, nc_name, data_type, long_name, units, data, kargs, fill_
     if units is not None:
         nc_var.units = units
 
+    if data is None:
+        return nc_var
+
     if data_type is str:
-        for _n in range(len(data)):
-            nc_var[_n] = data[_n]
+        if len(data) > 0:
+            nc_var[:] = np.array(data, dtype=object)
+    elif np.dtype(data_type) == np.dtype('S1'):
+        # fixed-width strings: the last dimension is the character count, and netCDF4 splits the
+        # strings into characters in one write when _Encoding is set
+        nc_var._Encoding = 'ascii'
+        nc_var[:] = np.array(data, dtype=f'S{nc_var.shape[-1]}')
     else:
-        nc_var[...] = data
-    nc_ds.sync()
+        _write_slabs(nc_var, data, _slab_lines(nc_var, max_memory_mb))
+    _sync(nc_ds)
+    return nc_var
+
 
+# Packed add_loc storage - (data type, scale_factor) per location band.  Packed values are rounded, so the
+# maximum absolute error on read is half the scale factor: 5e-8 degrees (~5 mm) for lon / lat and 0.5 mm for elev.
+LOC_PACKING = {
+    'lon': ('i4', 1e-7),
+    'lat': ('i4', 1e-7),
+    'elev': ('i4', 1e-3),
+}
 
-def add_loc(nc_ds, loc_envi_file, fill_value = -9999.):
+
+def add_loc(nc_ds, loc_envi_file, fill_value = -9999., profile = None, packed = False, max_memory_mb = 512):
     """
-    Add a location file to the netcdf output
+    Add a location file to the netcdf output, reading the location file once in downtrack slabs
     Args:
         nc_ds: output netcdf dataset to modify (mutable)
         loc_envi_file: envi formatted location file to add from
+        fill_value: nodata value in the location file, and fill value of unpacked variables
+        profile: compression / chunking profile from COMPRESSION_PROFILES.  Defaults to uncompressed, or to
+                 'archive' when packed.
+        packed: if True, store lon / lat / elev as CF packed integers (scale_factor, see LOC_PACKING) instead of
+                doubles.  netCDF readers that apply scale_factor get values within half a scale step of the
+                originals, and nodata pixels are read as masked / fill.
+        max_memory_mb: approximate memory budget per slab in MB
 
     Returns:
 
     """
-    loc = envi.open(envi_header(loc_envi_file)).open_memmap(interleave='bip')
-    add_variable(nc_ds, "location/lon", "d", "Longitude (WGS-84)", "degrees east", loc[..., 0].copy(),
-                 {"dimensions": ("downtrack", "crosstrack")}, fill_value = fill_value)
-
-    add_variable(nc_ds, "location/lat", "d", "Latitude (WGS-84)", "degrees north", loc[..., 1].copy(),
-                 {"dimensions": ("downtrack", "crosstrack")}, fill_value = fill_value)
-
-    add_variable(nc_ds, "location/elev", "d", "Surface Elevation", "m", loc[..., 2].copy(),
-                 {"dimensions": ("downtrack", "crosstrack")}, fill_value = fill_value)
-    nc_ds.sync()
-
-
-def add_glt(nc_ds, glt_envi_file, fill_value = 0):
+    loc = open_memmap(envi_header(loc_envi_file), interleave='bip')
+    if packed and profile is None:
+        profile = 'archive'
+
+    variables = [("lon", "Longitude (WGS-84)", "degrees east"),
+                 ("lat", "Latitude (WGS-84)", "degrees north"),
+                 ("elev", "Surface Elevation", "m")]
+    with write_session(nc_ds):
+        nc_vars = []
+        for name, long_name, units in variables:
+            if packed:
+                data_type, scale_factor = LOC_PACKING[name]
+                nc_var = add_variable(nc_ds, f"location/{name}", data_type, long_name, units, None,
+                                      {"dimensions": ("downtrack", "crosstrack")},
+                                      fill_value = netCDF4.default_fillvals[data_type], profile = profile)
+                nc_var.scale_factor = scale_factor
+                nc_var.add_offset = 0.
+            else:
+                nc_var = add_variable(nc_ds, f"location/{name}", "d", long_name, units, None,
+                                      {"dimensions": ("downtrack", "crosstrack")}, fill_value = fill_value,
+                                      profile = profile)
+            nc_vars.append(nc_var)
+
+        slab_lines = _slab_lines(nc_vars[0], max_memory_mb / len(nc_vars))
+        for start in range(0, loc.shape[0], slab_lines):
+            slab = np.array(loc[start:start + slab_lines, ...], dtype=np.float64)
+            for _b, nc_var in enumerate(nc_vars):
+                if packed:
+                    nc_var[start:start + slab.shape[0], :] = np.ma.masked_equal(slab[..., _b], fill_value)
+                else:
+                    nc_var[start:start + slab.shape[0], :] = slab[..., _b]
+        _sync(nc_ds)
+
+
+def add_glt(nc_ds, glt_envi_file, fill_value = 0, profile = 'archive'):
     """
     Add a location file to the netcdf output
     Args:
         nc_ds: output netcdf dataset to modify (mutable)
         glt_envi_file: envi formatted location file to add from
+        profile: compression / chunking profile from COMPRESSION_PROFILES
 
     Returns:
     """
-    glt = envi.open(envi_header(glt_envi_file)).open_memmap(interleave='bip')
-    add_variable(nc_ds, "location/glt_x", "i4", "GLT Sample Lookup", "pixel location",
-                 glt[..., 0].copy(), {"dimensions": ("ortho_y", "ortho_x"), "zlib": True, "complevel": 9},
-                 fill_value = fill_value)
+    glt = open_memmap(envi_header(glt_envi_file), interleave='bip')
+    with write_session(nc_ds):
+        add_variable(nc_ds, "location/glt_x", "i4", "GLT Sample Lookup", "pixel location",
+                     glt[..., 0], {"dimensions": ("ortho_y", "ortho_x")},
+                     fill_value = fill_value, profile = profile)
 
-    add_variable(nc_ds, "location/glt_y", "i4", "GLT Line Lookup", "pixel location",
-                 glt[..., 1].copy(), {"dimensions": ("ortho_y", "ortho_x"), "zlib": True, "complevel": 9},
-                 fill_value = fill_value)
-    nc_ds.sync()
+        add_variable(nc_ds, "location/glt_y", "i4", "GLT Line Lookup", "pixel location",
+                     glt[..., 1], {"dimensions": ("ortho_y", "ortho_x")},
+                     fill_value = fill_value, profile = profile)
 
 
 def makeDims(nc_ds: netCDF4.Dataset, primary_envi_file: str, glt_envi_file: str = None):
@@ -156,19 +363,19 @@ def makeDims(nc_ds: netCDF4.Dataset, primary_envi_file: str, glt_envi_file: str
     Returns:
     """
 
-    primary_ds = envi.open(envi_header(primary_envi_file))
+    primary_ds = open_envi(envi_header(primary_envi_file))
     nc_ds.createDimension('downtrack', int(primary_ds.metadata['lines']))
     nc_ds.createDimension('crosstrack', int(primary_ds.metadata['samples']))
     nc_ds.createDimension('bands', int(primary_ds.metadata['bands']))
 
     # Geographical Dimensions
     if glt_envi_file is not None:
-        glt_ds = gdal.Open(glt_envi_file, gdal.GA_ReadOnly)
-        nc_ds.createDimension('ortho_y', glt_ds.RasterYSize)
-        nc_ds.createDimension('ortho_x', glt_ds.RasterXSize)
+        glt_probe = probe_raster(glt_envi_file)
+        nc_ds.createDimension('ortho_y', glt_probe.y_size)
+        nc_ds.createDimension('ortho_x', glt_probe.x_size)
 
     # flush
-    nc_ds.sync()
+    _sync(nc_ds)
 
 
 def makeGlobalAttrBase(nc_ds: netCDF4.Dataset):
@@ -216,7 +423,7 @@ source regions that can be used to improve forecasts of the role of mineral dust
 
     #nc_ds.processing_level = "XXXX TO BE UPDATED"
 
-    nc_ds.sync()  # flush
+    _sync(nc_ds)  # flush
 
 
 
@@ -235,7 +442,7 @@ def makeGlobalAttr(nc_ds: netCDF4.Dataset, primary_envi_file: str, software_deli
 
     makeGlobalAttrBase(nc_ds)
 
-    primary_ds = envi.open(envi_header(primary_envi_file))
+    primary_ds = open_envi(envi_header(primary_envi_file))
 
     nc_ds.flight_line = os.path.basename(primary_envi_file)[:31]
 
@@ -244,14 +451,16 @@ def makeGlobalAttr(nc_ds: netCDF4.Dataset, primary_envi_file: str, software_deli
     nc_ds.software_build_version = primary_ds.metadata['emit software build version']
     nc_ds.software_delivery_version = software_delivery_version
     nc_ds.product_version = "V0" + primary_ds.metadata['emit data product version']
+    # copy, as the cached dataset's metadata is shared
+    pge_input_files = list(primary_ds.metadata['emit pge input files'])
     if rdn_runconfig_file is not None:
         with open(rdn_runconfig_file, "r") as f:
             runconfig = json.load(f)
         ffupdate_files = [os.path.basename(p) for p in runconfig["flat_field_update_paths"]]
         ffupdate_str = ",".join(ffupdate_files)
-        primary_ds.metadata['emit pge input files'].append(f"ffupdate_files=[{ffupdate_str}]")
+        pge_input_files.append(f"ffupdate_files=[{ffupdate_str}]")
     run_command = "PGE Run Command: {" + primary_ds.metadata['emit pge run command'] + "}"
-    input_files = "PGE Input Files: {" + ", ".join(primary_ds.metadata['emit pge input files']) + "}"
+    input_files = "PGE Input Files: {" + ", ".join(pge_input_files) + "}"
     nc_ds.history = run_command + ", " + input_files
     if 'flip horizontal' in primary_ds.metadata.keys():
         if int(primary_ds.metadata['flip horizontal']) == 1:
@@ -261,20 +470,22 @@ def makeGlobalAttr(nc_ds: netCDF4.Dataset, primary_envi_file: str, software_deli
 
     # only include spatial information if provided (may not be available for all PGEs)
     if glt_envi_file is not None:
-        ul_lr, res = _get_spatial_extent_res(glt_envi_file)
-        nc_ds.easternmost_longitude = ul_lr[2]
-        nc_ds.northernmost_latitude = ul_lr[1]
-        nc_ds.westernmost_longitude = ul_lr[0]
-        nc_ds.southernmost_latitude = ul_lr[3]
+        # bounds of the valid data, rather than of the (mostly empty, for a rotated swath) GLT raster
+        _, res = _get_spatial_extent_res(glt_envi_file)
+        footprint = glt_footprint(glt_envi_file)
+        nc_ds.easternmost_longitude = footprint.east
+        nc_ds.northernmost_latitude = footprint.north
+        nc_ds.westernmost_longitude = footprint.west
+        nc_ds.southernmost_latitude = footprint.south
         nc_ds.spatialResolution = res
 
-        gdal_ds = gdal.Open(glt_envi_file)
-        nc_ds.spatial_ref = gdal_ds.GetProjection()
-        nc_ds.geotransform = gdal_ds.GetGeoTransform()
+        glt_probe = probe_raster(glt_envi_file)
+        nc_ds.spatial_ref = glt_probe.projection
+        nc_ds.geotransform = glt_probe.geotransform
 
     nc_ds.day_night_flag = primary_ds.metadata['emit acquisition daynight']
 
-    nc_ds.sync()  # flush
+    _sync(nc_ds)  # flush
 
 
 def get_required_ummg():
@@ -315,8 +526,7 @@ def initialize_ummg(granule_name: str, creation_time: datetime, collection_name:
     """
 
     ummg = get_required_ummg()
-    ummg['MetadataSpecification'] = {'URL': 'https://cdn.earthdata.nasa.gov/umm/granule/v1.6.5', 'Name': 'UMM-G',
-                                     'Version': '1.6.5'}
+    ummg['MetadataSpecification'] = {'URL': UMMG_URL, 'Name': 'UMM-G', 'Version': UMMG_VERSION}
 
     
     ummg['Platforms'] = [{'ShortName': 'ISS', 'Instruments': [{'ShortName': 'EMIT Imaging Spectrometer'}]}]
@@ -370,6 +580,9 @@ def initialize_ummg(granule_name: str, creation_time: datetime, collection_name:
         ummg['AdditionalAttributes'].append({'Name': 'MEAN_FRACTIONAL_COVER', 'Values': [f"{mean_fractional_cover:.2f}"]})
     if mean_spectral_abundance is not None:
         ummg['AdditionalAttributes'].append({'Name': 'MEAN_SPECTRAL_ABUNDANCE', 'Values': [f"{mean_spectral_abundance:.2f}"]})
+    if len(ummg['AdditionalAttributes']) == 0:
+        # UMM-G requires at least one item when the field is present
+        del ummg['AdditionalAttributes']
 
     ummg['PGEVersionClass'] = {'PGEName': pge_name, 'PGEVersion': pge_version}
 
@@ -435,7 +648,8 @@ def add_boundary_ummg(ummg: dict, boundary_points: list):
     Add boundary points list to UMMG in correct format
     Args:
         ummg: existing UMMG to augment
-        boundary_points: list of lists, each major list entry is a pair of (lon, lat) coordinates
+        boundary_points: list of lists, each major list entry is a pair of (lon, lat) coordinates, counter-clockwise
+                         - e.g. footprint.glt_footprint(glt_file).boundary
 
     Returns:
         dictionary representation of ummg
@@ -467,13 +681,17 @@ def add_boundary_ummg(ummg: dict, boundary_points: list):
     return ummg
 
 
-def add_data_files_ummg(ummg: dict, data_file_names: list, daynight: str, file_formats: list =['NETCDF-4']):
+def add_data_files_ummg(ummg: dict, data_file_names: list, daynight: str, file_formats: list =['NETCDF-4'],
+                        workers: int = 4, checksum_cache: ChecksumCache = None, verify_checksums: bool = False):
     """
     Add boundary points list to UMMG in correct format
     Args:
         ummg: existing UMMG to augment
         data_file_names: list of paths to existing data files to add
         file_formats: description of file types
+        workers: number of files to checksum concurrently
+        checksum_cache: optional ChecksumCache to skip rehashing unchanged files
+        verify_checksums: if True, rehash every file even when cached
 
     Returns:
         dictionary representation of ummg with new data granule
@@ -489,14 +707,19 @@ def add_data_files_ummg(ummg: dict, data_file_names: list, daynight: str, file_f
             prod_datetime_str = subdict['Date']
             break
 
+    # hashlib releases the GIL on large reads, so files hash concurrently; map keeps the input order
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(data_file_names)))) as executor:
+        checksums = list(executor.map(lambda f: calc_checksum(f, cache=checksum_cache, verify=verify_checksums),
+                                      data_file_names))
+
     archive_info = []
-    for filename, fileformat in zip(data_file_names, file_formats):
+    for filename, fileformat, checksum in zip(data_file_names, file_formats, checksums):
         archive_info.append({
                              "Name": os.path.basename(filename),
                              "SizeInBytes": os.path.getsize(filename),
                              "Format": fileformat,
                              "Checksum": {
-                                 'Value': calc_checksum(filename),
+                                 'Value': checksum,
                                  'Algorithm': 'SHA-512'
                                  }
                             })
@@ -512,22 +735,34 @@ def add_data_files_ummg(ummg: dict, data_file_names: list, daynight: str, file_f
     return ummg
 
 
-def write_ummg(output_filename: str, ummg: dict):
+def write_ummg(output_filename: str, ummg: dict, fsync: bool = False):
     """
-    Write UMMG file to disk
+    Validate and write UMMG file to disk.  The file is written to a temporary name and renamed into place, so
+    readers never see a partial file.
     Args:
         output_filename: destination to write file to
         ummg: dictionary to write out
+        fsync: flush the file to disk before renaming it into place
 
     Returns:
-        none
+        list: validation errors - nothing is written if there are any
     """
-    errors = check_ummg()
+    errors = check_ummg(ummg)
     if len(errors) > 0:
         return errors
 
-    with open(output_filename, errors='ignore') as fout:
-        fout.write(json.dumps(ummg, indent=2, sort_keys=False))
+    tmp_filename = f'{output_filename}.tmp.{os.getpid()}'
+    try:
+        with open(tmp_filename, 'w', errors='ignore') as fout:
+            fout.write(json.dumps(ummg, indent=2, sort_keys=False, cls=SerialEncoder))
+            if fsync:
+                fout.flush()
+                os.fsync(fout.fileno())
+        os.replace(tmp_filename, output_filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+    return errors
 
 
 def check_ummg(ummg: dict):
@@ -536,24 +771,25 @@ def check_ummg(ummg: dict):
         ummg: dict to check for UMMG format
 
     Returns:
-        error: list of errors
+        error: list of errors, from the UMM-G 1.6.5 structural schema
 
     """
-    error_list = []
-    base_ummg = get_required_ummg()
-    for key in base_ummg.keys():
-        if key not in ummg.keys() or isinstance(type(base_ummg[key]), type(ummg[key])) is False:
-            error_list.append(f'Key {key} missing or formatted incorrectly')
+    return validate_ummg(ummg)
 
-    return error_list
 
+def calc_checksum(path, hash_alg="sha512", buffer_size=DEFAULT_BUFFER_SIZE, cache: ChecksumCache = None,
+                  verify: bool = False):
+    """
+    Calculate the checksum of a file
+    Args:
+        path: file to checksum
+        hash_alg: hashlib (or UMM-G style) algorithm name
+        buffer_size: read size in bytes
+        cache: optional ChecksumCache, so unchanged files (same path, size, mtime_ns and inode) are not reread
+        verify: if True, rehash even when cached and update the cache
 
-def calc_checksum(path, hash_alg="sha512"):
-    checksum = {}
-    if hash_alg.lower() == "sha512":
-        h = hashlib.sha512()
-    with open(path, "rb") as f:
-        # Read and update hash string value in blocks of 4K
-        for byte_block in iter(lambda: f.read(4096), b""):
-            h.update(byte_block)
-    return h.hexdigest()
+    Returns:
+        str: hex digest
+    """
+    checksums, _ = calc_checksums(path, [hash_alg], buffer_size=buffer_size, cache=cache, verify=verify)
+    return checksums[hash_alg]
@@ -0,0 +1,200 @@
+"""
+Process-level LRU cache of parsed ENVI headers, spectral datasets, memmaps and GDAL raster metadata probes, so that
+the many entry points that read the same granule files (daac_converter, file_checks, multi_raster_info) parse each
+header or open each raster once.
+
+Entries are keyed by path and validated against the size, mtime_ns and inode of the header and data files on every
+lookup, so a rewritten file is reopened rather than served stale.  Cached objects are shared - treat them as
+read-only (read_header returns a copy that callers may modify).
+"""
+
+import copy
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from osgeo import gdal
+from spectral.io import envi
+
+_max_entries = 32
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _file_ids(paths):
+    ids = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        ids.append((st.st_size, st.st_mtime_ns, st.st_ino))
+    return tuple(ids)
+
+
+def _lookup(key):
+    with _lock:
+        entry = _entries.get(key)
+    if entry is None:
+        return None
+    file_ids, value, paths = entry
+    if file_ids is None or _file_ids(paths) != file_ids:
+        return None
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+    return value
+
+
+def _store(key, value, paths, file_ids):
+    with _lock:
+        _entries[key] = (file_ids, value, paths)
+        _entries.move_to_end(key)
+        while len(_entries) > _max_entries:
+            _entries.popitem(last=False)
+    return value
+
+
+def open_envi(header_path: str):
+    """
+    Open (or reuse) a spectral ENVI dataset
+    Args:
+        header_path: ENVI header path (see file_checks.envi_header)
+
+    Returns:
+        spectral SpyFile: shared dataset - do not modify its metadata
+    """
+    header_path = os.path.realpath(header_path)
+    key = ('envi', header_path)
+    value = _lookup(key)
+    if value is not None:
+        return value
+
+    header_ids = _file_ids([header_path])
+    img = envi.open(header_path)
+    paths = (header_path, os.path.realpath(img.filename))
+    data_ids = _file_ids(paths[1:])
+    file_ids = None if header_ids is None or data_ids is None else header_ids + data_ids
+    return _store(key, img, paths, file_ids)
+
+
+def open_memmap(header_path: str, interleave: str = 'bip'):
+    """
+    Open (or reuse) a read-only memmap of an ENVI dataset
+    Args:
+        header_path: ENVI header path (see file_checks.envi_header)
+        interleave: memmap interleave (bip, bil, or bsq)
+
+    Returns:
+        numpy memmap: shared, read-only
+    """
+    header_path = os.path.realpath(header_path)
+    key = ('memmap', header_path, interleave)
+    value = _lookup(key)
+    if value is not None:
+        return value
+
+    img = open_envi(header_path)
+    paths = (header_path, os.path.realpath(img.filename))
+    file_ids = _file_ids(paths)
+    return _store(key, img.open_memmap(interleave=interleave, writable=False), paths, file_ids)
+
+
+def read_header(header_path: str):
+    """
+    Read (or reuse) a parsed ENVI header, without requiring the data file
+    Args:
+        header_path: ENVI header path
+
+    Returns:
+        dict: copy of the header metadata, safe to modify
+    """
+    header_path = os.path.realpath(header_path)
+    key = ('header', header_path)
+    value = _lookup(key)
+    if value is None:
+        file_ids = _file_ids([header_path])
+        value = _store(key, envi.read_envi_header(header_path), (header_path,), file_ids)
+    return copy.deepcopy(value)
+
+
+class RasterProbe(NamedTuple):
+    """Raster metadata gathered from a single GDAL open"""
+    path: str
+    driver: str
+    x_size: int
+    y_size: int
+    band_count: int
+    geotransform: tuple
+    projection: str
+    gcp_projection: str
+    file_list: tuple
+
+
+def probe_raster(path: str, allowed_drivers: list = None):
+    """
+    Open (or reuse) the metadata of a GDAL raster - driver, size, band count, geotransform and projections
+    Args:
+        path: raster path, as passed to gdal.OpenEx.  GDAL virtual paths (e.g. /vsis3/) are probed but not cached.
+        allowed_drivers: GDAL driver short names to try (e.g. ['ENVI']), or None to let GDAL choose.  Part of the
+                         cache key, so a restricted probe never reuses an unrestricted one.
+
+    Returns:
+        RasterProbe: metadata record, or None if GDAL cannot open the file (with an allowed driver)
+    """
+    if os.path.exists(path):
+        path = os.path.realpath(path)
+    key = ('probe', path, None if allowed_drivers is None else tuple(allowed_drivers))
+    value = _lookup(key)
+    if value is not None:
+        return value
+
+    path_ids = _file_ids([path])
+    try:
+        ds = gdal.OpenEx(path, gdal.OF_RASTER | gdal.OF_READONLY,
+                         allowed_drivers=None if allowed_drivers is None else list(allowed_drivers))
+    except RuntimeError:
+        ds = None
+    if ds is None:
+        return None
+
+    # sidecar files (e.g. ENVI headers) carry the georeferencing, so they are part of the cache key
+    file_list = tuple([os.path.realpath(f) if os.path.exists(f) else f for f in (ds.GetFileList() or [path])])
+    probe = RasterProbe(path=path, driver=ds.GetDriver().ShortName, x_size=ds.RasterXSize, y_size=ds.RasterYSize,
+                        band_count=ds.RasterCount, geotransform=tuple(ds.GetGeoTransform()),
+                        projection=ds.GetProjection(), gcp_projection=ds.GetGCPProjection(), file_list=file_list)
+    del ds
+
+    paths = tuple([path] + [f for f in file_list if f != path])
+    sidecar_ids = _file_ids(paths[1:])
+    file_ids = None if path_ids is None or sidecar_ids is None else path_ids + sidecar_ids
+    return _store(key, probe, paths, file_ids)
+
+
+def invalidate(path: str = None):
+    """
+    Drop cached entries
+    Args:
+        path: header or data file whose entries should be dropped, or None to clear the cache
+    """
+    with _lock:
+        if path is None:
+            _entries.clear()
+            return
+        path = os.path.realpath(path)
+        for key in [k for k, entry in _entries.items() if path in entry[2]]:
+            del _entries[key]
+
+
+def set_cache_size(max_entries: int):
+    """
+    Set the maximum number of cached entries, evicting the least recently used as needed
+    Args:
+        max_entries: maximum number of entries
+    """
+    global _max_entries
+    with _lock:
+        _max_entries = max_entries
+        while len(_entries) > _max_entries:
+            _entries.popitem(last=False)
@@ -5,30 +5,270 @@ Author: Philip G. Brodrick, philip.brodrick@jpl.nasa.gov
 """
 
 import os
-from osgeo import gdal
 import logging
 import numpy as np
-from spectral.io import envi
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, NamedTuple
 
+from emit_utils.dataset_cache import open_envi, probe_raster, read_header
 
-def check_cloudfraction(mask_file: str, mask_band=7) -> float:
+
+# EMIT band indices used for UMMG statistics
+OBS_SOLAR_AZIMUTH_BAND = 3
+OBS_SOLAR_ZENITH_BAND = 4
+MASK_AOD_BAND = 5
+MASK_WATER_VAPOR_BAND = 6
+MASK_AGGREGATE_BAND = 7
+
+
+class BandReader:
+    """
+    Read selected bands of an ENVI file over a range of lines, touching only the bytes those bands occupy:
+    one contiguous read per band for BSQ, one read per line and band for BIL, and one contiguous read of the
+    line range for BIP (where every band shares each page anyway).  Reads go straight into the output arrays, and
+    are positional, so read may be called from several threads at once.
+
+    Args:
+        input_file: ENVI file
+    """
+
+    def __init__(self, input_file: str):
+        img = open_envi(envi_header(input_file))
+        self.interleave = img.metadata['interleave'].lower()
+        self.lines, self.samples, self.bands = img.nrows, img.ncols, img.nbands
+        self.dtype = np.dtype(img.dtype)
+        self.offset = img.offset
+        self._file = open(img.filename, 'rb', buffering=0)
+
+    def _readinto(self, offset, out):
+        # positional reads - no shared file position, so one reader can serve many threads
+        position = self.offset + offset * self.dtype.itemsize
+        view = memoryview(out.reshape(-1).view(np.uint8))
+        n_read = 0
+        while n_read < view.nbytes:
+            n = os.preadv(self._file.fileno(), [view[n_read:]], position + n_read)
+            if n == 0:
+                raise EOFError(f'Unexpected end of file reading {self._file.name}')
+            n_read += n
+
+    def read(self, bands: List[int], line_start: int, line_stop: int):
+        """
+        Read bands over lines [line_start, line_stop)
+        Args:
+            bands: band indices
+            line_start: first line
+            line_stop: one past the last line
+
+        Returns:
+            dict: (lines, samples) array for each band
+        """
+        line_stop = min(line_stop, self.lines)
+        n_lines = line_stop - line_start
+        out = {}
+        if self.interleave == 'bsq':
+            for band in bands:
+                out[band] = np.empty((n_lines, self.samples), dtype=self.dtype)
+                self._readinto((band * self.lines + line_start) * self.samples, out[band])
+        elif self.interleave == 'bil':
+            for band in bands:
+                out[band] = np.empty((n_lines, self.samples), dtype=self.dtype)
+                for line in range(n_lines):
+                    self._readinto(((line_start + line) * self.bands + band) * self.samples, out[band][line])
+        else:
+            block = np.empty((n_lines, self.samples, self.bands), dtype=self.dtype)
+            self._readinto(line_start * self.samples * self.bands, block)
+            for band in bands:
+                out[band] = np.ascontiguousarray(block[..., band])
+        return out
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class StatRequest(NamedTuple):
+    """
+    One statistic of one band, for SceneStats.
+        name: key of the result
+        band: band index
+        stat: 'fraction_above' (percent of all pixels > value), 'fraction_equal' (percent of all pixels == value),
+              or, over valid pixels only, 'mean', 'min', 'max', 'count', or 'percentile' (value is q, or a list of q)
+        value: threshold, value, or percentile(s), as required by stat
+        nodata: pixels equal to nodata are not valid
+        valid_min: pixels less than or equal to valid_min are not valid
+    """
+    name: str
+    band: int
+    stat: str
+    value: object = None
+    nodata: float = None
+    valid_min: float = None
+
+
+class SceneStats:
+    """
+    Compute many statistics of one ENVI file in a single streaming pass over line blocks.  Each band is read once
+    per block (with BandReader, so only its bytes are read) regardless of how many statistics use it.  Blocks are
+    reduced on a thread pool, and their partial counts and extremes merged in block order, with only block-sized
+    temporaries.  Means and percentiles are exact, which costs memory: their valid values are gathered into one
+    scene-sized buffer per band and validity rule, in scene order, and reduced once at the end, so they match
+    numpy on the full band (per-block partial sums would not be bit-identical to np.mean's pairwise summation).
+
+    Args:
+        input_file: ENVI file
+        requests: list of StatRequest
+        block_lines: lines read per block
+        n_threads: number of threads reducing blocks
+    """
+
+    _fraction_stats = ['fraction_above', 'fraction_equal']
+    _valid_stats = ['mean', 'min', 'max', 'count', 'percentile']
+
+    def __init__(self, input_file: str, requests: List[StatRequest], block_lines: int = 256, n_threads: int = 4):
+        self.input_file = input_file
+        self.requests = list(requests)
+        self.block_lines = block_lines
+        self.n_threads = n_threads
+        for request in self.requests:
+            if request.stat not in self._fraction_stats + self._valid_stats:
+                raise AttributeError(f'Unknown statistic {request.stat} for {request.name}')
+
+    @staticmethod
+    def _valid(band_block, nodata, valid_min):
+        valid = np.ones(band_block.shape, dtype=bool)
+        if nodata is not None:
+            valid &= band_block != nodata
+        if valid_min is not None:
+            valid &= band_block > valid_min
+        return valid
+
+    @staticmethod
+    def _percentiles(values, q):
+        # np.percentile partitions the buffer in place (it is private) rather than copying it, and each q after
+        # the first works on already partitioned data.  Selection does not depend on input order, so results
+        # match np.percentile on the unordered values exactly.
+        results = [np.percentile(values, _q, overwrite_input=True) for _q in np.atleast_1d(q).tolist()]
+        return results if np.ndim(q) > 0 else results[0]
+
+    def _reduce_block(self, reader, bands, buffers, start):
+        # Reduce one block.  Valid values are written at the block's own pixel offset in each buffer, which no
+        # other block touches, and compacted into scene order by compute as blocks complete.
+        band_blocks = reader.read(bands, start, start + self.block_lines)
+        offset = start * reader.samples
+        counts, extremes, sizes = {}, {}, {}
+        for band in bands:
+            band_requests = [r for r in self.requests if r.band == band]
+            band_block = band_blocks[band]
+
+            # valid values of this block, once per validity rule
+            valid_values = {}
+            for r in band_requests:
+                key = (band, r.nodata, r.valid_min)
+                if r.stat in self._valid_stats and key not in valid_values:
+                    valid_values[key] = band_block[self._valid(band_block, r.nodata, r.valid_min)]
+                    if key in buffers:
+                        buffers[key][offset:offset + valid_values[key].size] = valid_values[key]
+                        sizes[key] = valid_values[key].size
+
+            for r in band_requests:
+                if r.stat == 'fraction_above':
+                    counts[r.name] = int(np.count_nonzero(band_block > (0 if r.value is None else r.value)))
+                elif r.stat == 'fraction_equal':
+                    counts[r.name] = int(np.count_nonzero(band_block == r.value))
+                elif r.stat == 'count':
+                    counts[r.name] = valid_values[(band, r.nodata, r.valid_min)].size
+                elif r.stat in ['min', 'max']:
+                    values = valid_values[(band, r.nodata, r.valid_min)]
+                    if values.size > 0:
+                        extremes[r.name] = np.min(values) if r.stat == 'min' else np.max(values)
+        return offset, counts, extremes, sizes
+
+    def compute(self):
+        """
+        Run the pass
+
+        Returns:
+            dict: results keyed by request name.  Fractions are percents (0-100); percentiles are a list when q
+                  is a list; valid-pixel statistics are None if there are no valid pixels.
+        """
+        reader = BandReader(self.input_file)
+        n_lines, n_samples = reader.lines, reader.samples
+        n_pixels = n_lines * n_samples
+
+        counts = {r.name: 0 for r in self.requests if r.stat in self._fraction_stats + ['count']}
+        extremes = {r.name: None for r in self.requests if r.stat in ['min', 'max']}
+        # one scene-sized buffer of valid values per (band, nodata, valid_min), shared by its mean / percentile
+        # requests
+        buffers, filled = {}, {}
+        for r in self.requests:
+            if r.stat in ['mean', 'percentile']:
+                buffers.setdefault((r.band, r.nodata, r.valid_min), None)
+        for key in buffers:
+            buffers[key] = np.empty(n_pixels, dtype=reader.dtype)
+            filled[key] = 0
+
+        bands = sorted(set([r.band for r in self.requests]))
+        starts = range(0, n_lines, self.block_lines)
+        with reader, ThreadPoolExecutor(max_workers=max(1, self.n_threads)) as executor:
+            # map yields blocks in order, so merging (and compaction) happens in scene order
+            for offset, block_counts, block_extremes, block_sizes in \
+                    executor.map(lambda start: self._reduce_block(reader, bands, buffers, start), starts):
+                for name, count in block_counts.items():
+                    counts[name] += count
+                for r in self.requests:
+                    if r.name in block_extremes:
+                        reduce = np.min if r.stat == 'min' else np.max
+                        extremes[r.name] = block_extremes[r.name] if extremes[r.name] is None else \
+                            reduce([extremes[r.name], block_extremes[r.name]])
+                # filled never passes offset, so this only moves values within blocks that are already done
+                for key, size in block_sizes.items():
+                    if filled[key] != offset:
+                        buffers[key][filled[key]:filled[key] + size] = buffers[key][offset:offset + size]
+                    filled[key] += size
+
+        results = {}
+        # percentiles partition their buffer in place, so they go after the means that share it
+        for r in sorted(self.requests, key=lambda r: r.stat == 'percentile'):
+            if r.stat in self._fraction_stats:
+                results[r.name] = counts[r.name] * 100 / n_pixels
+            elif r.stat == 'count':
+                results[r.name] = counts[r.name]
+            elif r.stat in ['min', 'max']:
+                results[r.name] = extremes[r.name]
+            else:
+                key = (r.band, r.nodata, r.valid_min)
+                values = buffers[key][:filled[key]]
+                if values.size == 0:
+                    results[r.name] = None
+                elif r.stat == 'mean':
+                    results[r.name] = np.mean(values)
+                else:
+                    results[r.name] = self._percentiles(values, r.value)
+        return {r.name: results[r.name] for r in self.requests}
+
+
+def check_cloudfraction(mask_file: str, mask_band=MASK_AGGREGATE_BAND, n_threads: int = 4) -> float:
     """
     Determines the cloud fraction from a mask file
 
     Args:
         mask_file (str): mask file (EMIT style)
         mask_band (int, optional): Band number to estimate clouds from.
+        n_threads (int, optional): Number of threads reducing line blocks.
 
     Returns:
         float: cloud fraction as rounded percent (0-100)
     """
-    ds = envi.open(envi_header(mask_file))
-    clouds = ds.open_memmap(interleave='bip')[...,mask_band]
-    
-    fraction = np.sum(clouds > 0) * 100 / np.prod(clouds.shape) 
-    return int(np.round(fraction))
+    stats = SceneStats(mask_file, [StatRequest('clouds', mask_band, 'fraction_above', 0)],
+                       n_threads=n_threads).compute()
+    return int(np.round(stats['clouds']))
 
-def check_nodatafraction(input_file: str, band=0, no_data_value=-9999) -> float:
+def check_nodatafraction(input_file: str, band=0, no_data_value=-9999, n_threads: int = 4) -> float:
     """
     Determines the no data fraction from an input file
 
@@ -36,32 +276,68 @@ def check_nodatafraction(input_file: str, band=0, no_data_value=-9999) -> float:
         input_file (str): ENVI file
         band (int, optional): Band number to calculate no data fraction from.
         no_data_value (int, optional): No data value
+        n_threads (int, optional): Number of threads reducing line blocks.
 
     Returns:
         float: no data fraction as rounded percent (0-100)
     """
-    ds = envi.open(envi_header(input_file))
-    data = ds.open_memmap(interleave='bip')[..., band]
-    fraction = np.sum(data == no_data_value) * 100 / np.prod(data.shape)
-    return int(np.round(fraction))
+    stats = SceneStats(input_file, [StatRequest('nodata', band, 'fraction_equal', no_data_value)],
+                       n_threads=n_threads).compute()
+    return int(np.round(stats['nodata']))
 
-def check_daynight(obs_file: str, zenith_band=4):
+def _daynight(zenith_percentiles):
+    min_zenith, max_zenith = zenith_percentiles
+    if min_zenith < 90 and max_zenith < 90:
+        return 'day'
+    else:
+        return 'night'
+
+def check_daynight(obs_file: str, zenith_band=OBS_SOLAR_ZENITH_BAND, n_threads: int = 4):
     """
     Determine if an acquisition is from daytime or nighttime
     Args:
         obs_file: path to scene observation file
+        n_threads: number of threads reducing line blocks
 
     Returns:
         daynight: string indicator of day/night
     """
-    ds = envi.open(envi_header(obs_file))
-    zenith = ds.open_memmap(interleave='bip').open_memmap()[...,zenith_band]
-    min_zenith = np.percentile(zenith[zenith != -9999], 2)
-    max_zenith = np.percentile(zenith[zenith != -9999], 98)
-    if min_zenith < 90 and max_zenith < 90:
-        return 'day'
-    else:
-        return 'night'
+    stats = SceneStats(obs_file, [StatRequest('zenith', zenith_band, 'percentile', [2, 98], nodata=-9999)],
+                       n_threads=n_threads).compute()
+    return _daynight(stats['zenith'])
+
+def granule_ummg_stats(obs_file: str = None, mask_file: str = None, block_lines: int = 256, n_threads: int = 4):
+    """
+    Compute the scene statistics used in EMIT UMMG with one pass over each file
+    Args:
+        obs_file: observation file, for solar_zenith, solar_azimuth and day / night
+        mask_file: mask file, for cloud_fraction, water_vapor and aod
+        block_lines: lines read per block
+        n_threads: number of threads reducing line blocks
+
+    Returns:
+        dict: initialize_ummg keyword arguments (solar_zenith, solar_azimuth, cloud_fraction, water_vapor, aod)
+        str: UMMG DayNightFlag, 'Day' or 'Night' (check_daynight, capitalized), or None without an obs file
+    """
+    ummg_args, daynight = {}, None
+    if obs_file is not None:
+        stats = SceneStats(obs_file, [StatRequest('solar_zenith', OBS_SOLAR_ZENITH_BAND, 'mean', valid_min=-9990),
+                                      StatRequest('solar_azimuth', OBS_SOLAR_AZIMUTH_BAND, 'mean', valid_min=-9990),
+                                      StatRequest('zenith_percentiles', OBS_SOLAR_ZENITH_BAND, 'percentile', [2, 98],
+                                                  nodata=-9999)], block_lines=block_lines,
+                           n_threads=n_threads).compute()
+        ummg_args['solar_zenith'] = stats['solar_zenith']
+        ummg_args['solar_azimuth'] = stats['solar_azimuth']
+        daynight = _daynight(stats['zenith_percentiles']).capitalize()
+    if mask_file is not None:
+        stats = SceneStats(mask_file, [StatRequest('cloud_fraction', MASK_AGGREGATE_BAND, 'fraction_above', 0),
+                                       StatRequest('water_vapor', MASK_WATER_VAPOR_BAND, 'mean', valid_min=-9990),
+                                       StatRequest('aod', MASK_AOD_BAND, 'mean', valid_min=-9990)],
+                           block_lines=block_lines, n_threads=n_threads).compute()
+        ummg_args['cloud_fraction'] = int(np.round(stats['cloud_fraction']))
+        ummg_args['water_vapor'] = stats['water_vapor']
+        ummg_args['aod'] = stats['aod']
+    return ummg_args, daynight
 
 def check_files_exist(file_list: np.array):
     """ Check if files exist on the system.
@@ -89,7 +365,8 @@ def check_raster_drivers(file_list: np.array):
     """
     anybad = False
     for file in file_list:
-        if gdal.OpenEx(file, gdal.GA_ReadOnly, allowed_drivers=['ENVI']) is None:
+        probe = probe_raster(file, allowed_drivers=['ENVI'])
+        if probe is None or probe.driver != 'ENVI':
             logging.error('Input file: {} not a recognized raster format'.format(file))
             anybad = True
     if anybad:
@@ -104,10 +381,9 @@ def check_same_raster_projections(file_list: np.array):
         None
     """
     anybad = False
-    base_projection = gdal.Open(file_list[0], gdal.GA_ReadOnly).GetGCPSpatialRef()
+    base_projection = probe_raster(file_list[0], allowed_drivers=['ENVI']).gcp_projection
     for file in file_list:
-        dataset = gdal.Open(file, gdal.GA_ReadOnly)
-        if dataset.GetGCPSpatialRef() != base_projection:
+        if probe_raster(file, allowed_drivers=['ENVI']).gcp_projection != base_projection:
             logging.error('Projection in file {} differs from projection in file {}'.format(file, file_list[0]))
             anybad = True
     if anybad:
@@ -123,9 +399,9 @@ def check_same_raster_resolutions(file_list: np.array, fractional_tolerance: flo
         None
     """
     anybad = False
-    base_trans = gdal.Open(file_list[0], gdal.GA_ReadOnly).GetGeoTransform()
+    base_trans = probe_raster(file_list[0], allowed_drivers=['ENVI']).geotransform
     for file in file_list:
-        transform = gdal.Open(file, gdal.GA_ReadOnly).GetGeoTransform()
+        transform = probe_raster(file, allowed_drivers=['ENVI']).geotransform
         if abs((transform[1] - base_trans[1])/base_trans[1]) > fractional_tolerance and \
            abs((transform[5] - base_trans[5]) / base_trans[5]) > fractional_tolerance:
             logging.error('Resolution difference. File {} resolution: {} {}\n'
@@ -193,7 +469,7 @@ def netcdf_ext(basepath):
 
 
 def get_gring_boundary_points(glt_hdr_path: str):
-    hdr = envi.read_envi_header(glt_hdr_path)
+    hdr = read_header(glt_hdr_path)
     # Assume the gring list starts with "Geographic Lon/Lat" followed by pairs of lon/lat
     gring = hdr["gring"]
     points = []
@@ -202,18 +478,16 @@ def get_gring_boundary_points(glt_hdr_path: str):
     return points
 
 
-def get_band_mean(input_file: str, band) -> float:
+def get_band_mean(input_file: str, band, n_threads: int = 4) -> float:
     """
     Determines the mean of a band
     Args:
         input_file (str): obs file (EMIT style)
         band (int, optional): Band number retrieve average from.
+        n_threads (int, optional): Number of threads reducing line blocks.
     Returns:
         float: mean value of given band
     """
-    ds = envi.open(envi_header(input_file))
-    target = ds.open_memmap(interleave='bip')[..., band]
-
-    good = target > -9990
-
-    return np.mean(target[good])
\ No newline at end of file
+    stats = SceneStats(input_file, [StatRequest('mean', band, 'mean', valid_min=-9990)],
+                       n_threads=n_threads).compute()
+    return stats['mean']
\ No newline at end of file
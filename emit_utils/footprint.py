@@ -0,0 +1,171 @@
+"""
+Granule footprints for UMMG and global attributes - the valid-data boundary of a GLT or location file, found in one
+vectorized pass, transformed to lon / lat in a single batched call, and simplified to a bounded vertex count.
+"""
+
+from typing import List, NamedTuple
+
+import numpy as np
+from osgeo import osr
+
+from emit_utils.dataset_cache import open_memmap, probe_raster
+from emit_utils.file_checks import envi_header
+
+
+class Footprint(NamedTuple):
+    """Footprint polygon (counter-clockwise [lon, lat] vertices, not closed) and its exact bounds"""
+    boundary: List[list]
+    west: float
+    south: float
+    east: float
+    north: float
+
+
+def row_extremes(valid: np.array):
+    """
+    Find the first and last valid column in every row with valid data.  The convex hull of these pixels is the
+    convex hull of all valid pixels.
+    Args:
+        valid: 2d boolean mask
+
+    Returns:
+        np.array: rows with valid data
+        np.array: first valid column of each of those rows
+        np.array: last valid column of each of those rows
+    """
+    rows = np.where(np.any(valid, axis=1))[0]
+    valid = valid[rows, :]
+    first = np.argmax(valid, axis=1)
+    last = valid.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return rows, first, last
+
+
+def convex_hull(points: np.array):
+    """
+    Convex hull by Andrew's monotone chain
+    Args:
+        points: (n, 2) array of x, y points
+
+    Returns:
+        np.array: hull vertices, counter-clockwise (for y up), without repeating the first vertex
+    """
+    points = np.unique(np.asarray(points, dtype=np.float64), axis=0)
+    if len(points) < 3:
+        return points
+
+    def cross(o, a, b):
+        return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+    lower, upper = [], []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in points[::-1]:
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return np.array(lower[:-1] + upper[:-1])
+
+
+def simplify_polygon(points: np.array, max_vertices: int):
+    """
+    Reduce a closed polygon to at most max_vertices by repeatedly dropping the vertex that spans the smallest
+    triangle with its neighbors (Visvalingam-Whyatt).  On a convex hull this trims the least area possible
+    at each step.
+    Args:
+        points: (n, 2) array of polygon vertices, not closed
+        max_vertices: maximum number of vertices to keep (at least 3)
+
+    Returns:
+        np.array: simplified vertices, in the original order
+    """
+    points = np.asarray(points, dtype=np.float64)
+    max_vertices = max(3, max_vertices)
+    while len(points) > max_vertices:
+        prev_pts = np.roll(points, 1, axis=0)
+        next_pts = np.roll(points, -1, axis=0)
+        area = np.abs((points[:, 0] - prev_pts[:, 0]) * (next_pts[:, 1] - prev_pts[:, 1]) -
+                      (next_pts[:, 0] - prev_pts[:, 0]) * (points[:, 1] - prev_pts[:, 1]))
+        points = np.delete(points, np.argmin(area), axis=0)
+    return points
+
+
+def transform_to_lonlat(points: np.array, projection_wkt: str):
+    """
+    Transform map coordinates to lon / lat (WGS-84) in one batched call
+    Args:
+        points: (n, 2) array of x, y map coordinates
+        projection_wkt: projection of the points
+
+    Returns:
+        np.array: (n, 2) array of lon, lat
+    """
+    src = osr.SpatialReference()
+    src.ImportFromWkt(projection_wkt)
+    src.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    dst = osr.SpatialReference()
+    dst.ImportFromEPSG(4326)
+    dst.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    if src.IsSame(dst):
+        return np.asarray(points, dtype=np.float64)
+
+    transformer = osr.CoordinateTransformation(src, dst)
+    transformed = transformer.TransformPoints(np.asarray(points, dtype=np.float64).tolist())
+    return np.array(transformed)[:, :2]
+
+
+def _footprint(lonlat_points: np.array, max_vertices: int):
+    hull = convex_hull(lonlat_points)
+    if len(hull) == 0:
+        raise AttributeError('No valid data found to build a footprint from')
+    west, south = np.min(hull, axis=0)
+    east, north = np.max(hull, axis=0)
+    boundary = simplify_polygon(hull, max_vertices)
+    return Footprint(boundary=boundary.tolist(), west=float(west), south=float(south),
+                     east=float(east), north=float(north))
+
+
+def glt_footprint(glt_file: str, max_vertices: int = 32, glt_nodata_value: int = 0):
+    """
+    Footprint of the valid pixels of a GLT, using the outer pixel edges
+    Args:
+        glt_file: envi formatted GLT file (sample, line bands)
+        max_vertices: maximum number of polygon vertices
+        glt_nodata_value: GLT value marking pixels with no data
+
+    Returns:
+        Footprint: boundary polygon and bounds in lon / lat
+    """
+    glt = open_memmap(envi_header(glt_file), interleave='bip')
+    rows, first, last = row_extremes(glt[..., 0] != glt_nodata_value)
+
+    # outer corners of the first and last valid pixel in each row, in pixel edge coordinates
+    cols = np.concatenate([first, first, last + 1, last + 1])
+    lines = np.concatenate([rows, rows + 1, rows, rows + 1])
+
+    probe = probe_raster(glt_file)
+    gt = probe.geotransform
+    map_x = gt[0] + cols * gt[1] + lines * gt[2]
+    map_y = gt[3] + cols * gt[4] + lines * gt[5]
+    points = np.unique(np.stack([map_x, map_y], axis=-1), axis=0)
+    return _footprint(transform_to_lonlat(points, probe.projection), max_vertices)
+
+
+def loc_footprint(loc_file: str, max_vertices: int = 32, nodata_value: float = -9999.):
+    """
+    Footprint of the valid pixels of a location file, using pixel center coordinates
+    Args:
+        loc_file: envi formatted location file (lon, lat, elev bands)
+        max_vertices: maximum number of polygon vertices
+        nodata_value: location value marking pixels with no data
+
+    Returns:
+        Footprint: boundary polygon and bounds in lon / lat
+    """
+    loc = open_memmap(envi_header(loc_file), interleave='bip')
+    rows, first, last = row_extremes(loc[..., 0] != nodata_value)
+    lines = np.concatenate([rows, rows])
+    samples = np.concatenate([first, last])
+    points = np.array(loc[lines, samples, :2], dtype=np.float64)
+    return _footprint(points, max_vertices)
@@ -10,6 +10,8 @@ import numpy as np
 import logging
 import os
 
+from emit_utils.dataset_cache import probe_raster
+
 
 def get_bounding_extent(file_list: np.array, return_pixel_offsets=False, return_spatial_offsets=False,
                         return_global_lower_rights=False):
@@ -28,9 +30,9 @@ def get_bounding_extent(file_list: np.array, return_pixel_offsets=False, return_
     geotransforms = []
     extents = []
     for file in file_list:
-        dataset = gdal.Open(file, gdal.GA_ReadOnly)
-        geotransforms.append(dataset.GetGeoTransform())
-        extents.append((dataset.RasterXSize, dataset.RasterYSize))
+        probe = probe_raster(file)
+        geotransforms.append(probe.geotransform)
+        extents.append((probe.x_size, probe.y_size))
 
     # find bounding x and y coordinate locations
     min_x = np.nanmin([x[0] for x in geotransforms])
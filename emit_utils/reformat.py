@@ -4,8 +4,16 @@ A simple script to reformat EMIT netCDFs to alternate formats.
 Author: Philip G. Brodrick, philip.brodrick@jpl.nasa.gov
 """
 import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
 import netCDF4
 import numpy as np
+import traceback
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from osgeo import gdal
 from spectral.io import envi
 from emit_utils.file_checks import envi_header
 import os
@@ -25,6 +33,345 @@ envi_typemap = {
     'uint64': 15
 }
 
+gdal_typemap = {
+    'uint8': 'Byte',
+    'int8': 'Int8',
+    'int16': 'Int16',
+    'int32': 'Int32',
+    'float32': 'Float32',
+    'float64': 'Float64',
+    'complex64': 'CFloat32',
+    'complex128': 'CFloat64',
+    'uint16': 'UInt16',
+    'uint32': 'UInt32',
+    'int64': 'Int64',
+    'uint64': 'UInt64'
+}
+
+# ENVI header keys that describe the binary layout, and so are not carried into VRT attributes
+envi_layout_keys = ['lines', 'samples', 'bands', 'interleave', 'header offset', 'file type', 'data type', 'byte order']
+
+def write_bip_block(out_dat, block, start, interleave='bip'):
+    """Write a block of whole lines into an output opened in its native interleave, so each write
+    lands in the file as contiguous runs in file order
+
+    Args:
+        out_dat (array like): writable output in its native shape - bip (lines, samples, bands),
+                              bil (lines, bands, samples) or bsq (bands, lines, samples)
+        block (array like): block of lines in bip order (lines, samples, bands)
+        start (int): first output line of the block
+        interleave (str, optional): interleave of out_dat, one of bip, bil, bsq. Defaults to 'bip'.
+
+    Returns:
+        None
+    """
+    interleave = interleave.lower()
+    stop = start + block.shape[0]
+    if interleave == 'bip':
+        out_dat[start:stop, ...] = block
+    elif interleave == 'bil':
+        out_dat[start:stop, ...] = block.transpose((0, 2, 1))
+    elif interleave == 'bsq':
+        # one strided copy - the block dirties a single lines x samples run per band
+        out_dat[:, start:stop, :] = block.transpose((2, 0, 1))
+    else:
+        raise ValueError(f'Unknown interleave {interleave}')
+
+
+def _file_identity(path):
+    """Identify a file by real path, size and mtime, e.g. to tie a cache to the file it was built from"""
+    st = os.stat(path)
+    return [os.path.realpath(path), st.st_size, st.st_mtime_ns]
+
+
+def _npy_path(cache_file):
+    """np.save appends .npy to any other path, so name the cache the way it will land on disk"""
+    return cache_file if cache_file.endswith('.npy') else cache_file + '.npy'
+
+
+class GltIndex:
+    """Precomputed GLT lookup for orthorectifying any number of variables from one granule.
+
+    The GLT is reduced once to a 2d array of 0-based linear source indices (line * samples + sample),
+    with -1 marking invalid GLT pixels.  The input GLT is never modified.
+
+    Args:
+        index (array like): (ortho_y, ortho_x) int64 linear source indices, -1 where invalid
+        source_shape (tuple): (downtrack, crosstrack) shape of the swath the GLT points into
+        offset (tuple, optional): (row, column) of index[0, 0] within the full GLT. Defaults to (0, 0).
+    """
+
+    def __init__(self, index, source_shape, offset=(0, 0)):
+        self.index = index
+        self.source_shape = tuple(int(x) for x in source_shape)
+        self.offset = tuple(int(x) for x in offset)
+        self.valid = self.index >= 0
+        # offsets of each GLT row into the flattened list of valid source indices
+        self.row_offsets = np.concatenate([[0], np.cumsum(np.sum(self.valid, axis=1))])
+        self.src_index = np.asarray(self.index[self.valid])
+
+    @property
+    def shape(self):
+        """tuple: (ortho_y, ortho_x) shape of the orthorectified output"""
+        return self.index.shape
+
+    @classmethod
+    def from_glt(cls, glt, source_shape, glt_nodata_value=0, offset=(0, 0)):
+        """Build an index from a GLT array
+
+        Args:
+            glt (array like): glt - 2 band 1-based indexing for output file(x, y)
+            source_shape (tuple): (downtrack, crosstrack) shape of the swath the GLT points into
+            glt_nodata_value (int, optional): Value from glt to ignore. Defaults to 0.
+            offset (tuple, optional): (row, column) of glt[0, 0] within the full GLT. Defaults to (0, 0).
+
+        Returns:
+            GltIndex: precomputed index
+        """
+        glt = np.asarray(glt)
+        valid_glt = np.all(glt != glt_nodata_value, axis=-1)
+        index = np.full(glt.shape[:2], -1, dtype=np.int64)
+        # account for 1-based indexing
+        index[valid_glt] = (glt[valid_glt, 1].astype(np.int64) - 1) * source_shape[1] + \
+                           (glt[valid_glt, 0].astype(np.int64) - 1)
+        return cls(index, source_shape, offset=offset)
+
+    @classmethod
+    def from_netcdf(cls, nc_ds, cache_file=None, bbox=None):
+        """Build an index from the location/glt_x and location/glt_y variables of an EMIT netCDF,
+        optionally reusing (or creating) a .npy cache of the index.
+
+        The cache is reused when its source and GLT shapes match and it was built from this same file (path, size
+        and mtime), or from another file - e.g. another product of the same scene - with identical glt_x / glt_y.
+        Otherwise it is rebuilt.
+
+        Args:
+            nc_ds (netCDF4.Dataset): open EMIT netCDF with a location group
+            cache_file (str, optional): .npy sidecar to load from if present and consistent, or save to otherwise
+            bbox (array like, optional): min x, min y, max x, max y in map coordinates to crop the index to, using
+                                         the geotransform global attribute.  Without a cache_file, only the GLT
+                                         window covering the bbox is read.
+
+        Returns:
+            GltIndex: precomputed index
+        """
+        source_shape = (nc_ds.dimensions['downtrack'].size, nc_ds.dimensions['crosstrack'].size)
+        glt_shape = nc_ds.groups['location']['glt_x'].shape
+        window = None
+        if bbox is not None:
+            window = bbox_to_window(nc_ds.__dict__['geotransform'], bbox, glt_shape)
+
+        def read_glt(rows, cols):
+            glt = np.zeros([rows.stop - rows.start, cols.stop - cols.start, 2], dtype=np.int32)
+            glt[...,0] = np.array(nc_ds.groups['location']['glt_x'][rows, cols])
+            glt[...,1] = np.array(nc_ds.groups['location']['glt_y'][rows, cols])
+            return glt
+
+        # the cache holds the full GLT, so in that case build it in full and crop afterwards
+        rows, cols = slice(0, glt_shape[0]), slice(0, glt_shape[1])
+        if window is not None and cache_file is None:
+            rows, cols = window
+
+        glt = None
+        if cache_file is not None:
+            cache_file = _npy_path(cache_file)
+        if cache_file is not None and os.path.isfile(cache_file):
+            metadata = cls.load_metadata(cache_file)
+            consistent = metadata is not None and metadata.get('source_shape') == list(source_shape) and \
+                metadata.get('shape') == list(glt_shape)
+            if consistent and metadata.get('source') != _file_identity(nc_ds.filepath()):
+                glt = read_glt(rows, cols)
+                consistent = metadata.get('glt_sha1') == hashlib.sha1(glt.tobytes()).hexdigest()
+            if consistent:
+                glt_index = cls.load(cache_file, source_shape)
+                return glt_index if window is None else glt_index.crop(*window)
+            logging.warning(f'GLT cache {cache_file} does not match {nc_ds.filepath()} - rebuilding')
+
+        if glt is None:
+            glt = read_glt(rows, cols)
+        glt_index = cls.from_glt(glt, source_shape, offset=(rows.start, cols.start))
+
+        if cache_file is not None:
+            glt_index.save(cache_file, metadata={'source': _file_identity(nc_ds.filepath()),
+                                                 'glt_sha1': hashlib.sha1(glt.tobytes()).hexdigest()})
+            if window is not None:
+                glt_index = glt_index.crop(*window)
+        return glt_index
+
+    def save(self, cache_file, metadata=None):
+        """Save the index as a .npy sidecar, with a .json record of its source and GLT shapes.
+
+        Both files are written to temporary names and moved into place, the record last, so a concurrent or
+        interrupted run never pairs a record with a partial or different index.
+
+        Args:
+            cache_file (str): output .npy file (.npy is appended if missing)
+            metadata (dict, optional): additional entries for the .json record (e.g. the source file identity)
+        """
+        cache_file = _npy_path(cache_file)
+        record = {'source_shape': list(self.source_shape), 'shape': list(self.shape)}
+        record.update({} if metadata is None else metadata)
+        tmp_suffix = f'.{os.getpid()}.tmp'
+        with open(cache_file + tmp_suffix, 'wb') as fout:
+            np.save(fout, self.index)
+        with open(cache_file + '.json' + tmp_suffix, 'w') as fout:
+            fout.write(json.dumps(record))
+        # drop any previous record before swapping in the new index
+        if os.path.isfile(cache_file + '.json'):
+            os.remove(cache_file + '.json')
+        os.replace(cache_file + tmp_suffix, cache_file)
+        os.replace(cache_file + '.json' + tmp_suffix, cache_file + '.json')
+
+    @staticmethod
+    def load_metadata(cache_file):
+        """Read the .json record saved alongside a cached index
+
+        Args:
+            cache_file (str): .npy file written by GltIndex.save
+
+        Returns:
+            dict: the record, or None if it is missing or unreadable
+        """
+        try:
+            with open(_npy_path(cache_file) + '.json', 'r') as fin:
+                return json.load(fin)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, cache_file, source_shape, mmap_mode='r'):
+        """Load an index saved with GltIndex.save
+
+        Args:
+            cache_file (str): .npy file to read
+            source_shape (tuple): (downtrack, crosstrack) shape of the swath the GLT points into
+            mmap_mode (str, optional): numpy memmap mode to open the index with. Defaults to 'r'.
+
+        Returns:
+            GltIndex: precomputed index
+        """
+        return cls(np.load(_npy_path(cache_file), mmap_mode=mmap_mode), source_shape)
+
+    def source_window(self):
+        """Get the smallest swath window that contains every source pixel referenced by the index
+
+        Returns:
+            tuple: (line slice, sample slice), or None if the index has no valid pixels
+        """
+        if len(self.src_index) == 0:
+            return None
+        lines = self.src_index // self.source_shape[1]
+        samples = self.src_index % self.source_shape[1]
+        return slice(int(lines.min()), int(lines.max()) + 1), slice(int(samples.min()), int(samples.max()) + 1)
+
+    def crop(self, rows, cols):
+        """Crop the index to a window of the ortho grid
+
+        Args:
+            rows (slice): GLT rows to keep
+            cols (slice): GLT columns to keep
+
+        Returns:
+            GltIndex: cropped index, with offset updated to locate it within the full GLT
+        """
+        rows = range(*rows.indices(self.shape[0]))
+        cols = range(*cols.indices(self.shape[1]))
+        index = np.asarray(self.index[rows.start:rows.stop, cols.start:cols.stop])
+        return GltIndex(index, self.source_shape, offset=(self.offset[0] + rows.start, self.offset[1] + cols.start))
+
+    def apply(self, img_dat, dtype=None):
+        """Orthorectify a full image in memory
+
+        Args:
+            img_dat (array like): raw input image (downtrack, crosstrack[, bands])
+            dtype (numpy dtype, optional): output data type.  Defaults to None, the input data type.
+
+        Returns:
+            array like: orthorectified version of img_dat, (ortho_y, ortho_x, bands)
+        """
+        img_dat = np.asarray(img_dat)
+        nbands = 1 if img_dat.ndim < 3 else img_dat.shape[2]
+        outdat = np.zeros((self.shape[0], self.shape[1], nbands), dtype=img_dat.dtype if dtype is None else dtype)
+        outdat[self.valid, :] = img_dat.reshape((-1, nbands))[self.src_index, :]
+        return outdat
+
+    def iter_blocks(self, img_dat, block_lines=None, max_memory_mb=512, bands=None):
+        """Orthorectify an image in blocks of GLT rows.
+        Source pixels referenced by each block are read as windows of downtrack lines and crosstrack samples,
+        each at most half of max_memory_mb, so img_dat can be a netCDF4 variable or a memmap without being
+        loaded in full.  On a rotated swath a single GLT row can span many source lines; its references are then
+        read in several windows rather than as one bounding rectangle.
+
+        Args:
+            img_dat (array like): raw input image (downtrack, crosstrack[, bands]), sliceable along the first axis
+            block_lines (int, optional): GLT rows per block.  Defaults to None, derived from max_memory_mb.
+            max_memory_mb (float, optional): approximate memory budget per block in MB. Defaults to 512.
+            bands (array like, optional): band indices to read from a 3d img_dat. Defaults to None, all bands.
+
+        Yields:
+            tuple: (first GLT row of the block, orthorectified block (rows, ortho_x, bands) in the source dtype)
+        """
+        nbands = 1 if len(img_dat.shape) < 3 else img_dat.shape[2]
+        if bands is not None and len(img_dat.shape) > 2:
+            nbands = len(bands)
+        samples = self.source_shape[1]
+        pixel_bytes = nbands * np.dtype(img_dat.dtype).itemsize
+        if block_lines is None:
+            block_lines = ortho_block_lines(self.shape[1], nbands, np.dtype(img_dat.dtype).itemsize, max_memory_mb)
+        read_pixels = max(1, int(max_memory_mb * 1024**2 / 2 // pixel_bytes))
+
+        for start in range(0, self.shape[0], block_lines):
+            stop = min(start + block_lines, self.shape[0])
+            src_index = self.src_index[self.row_offsets[start]:self.row_offsets[stop]]
+
+            outdat = np.zeros((stop - start, self.shape[1], nbands), dtype=img_dat.dtype)
+            if len(src_index) > 0:
+                flat_out = outdat.reshape((-1, nbands))
+                out_index = np.flatnonzero(self.valid[start:stop])
+                src_lines, src_samples = src_index // samples, src_index % samples
+                line_start, line_stop = src_lines.min(), src_lines.max() + 1
+                window_samples = src_samples.max() + 1 - src_samples.min()
+
+                if (line_stop - line_start) * window_samples <= read_pixels:
+                    windows = [np.arange(len(src_index))]
+                else:
+                    # split the referenced source lines into windows that fit the read budget
+                    order = np.argsort(src_lines, kind='stable')
+                    window_lines = max(1, read_pixels // window_samples)
+                    edges = np.searchsorted(src_lines[order], np.arange(line_start, line_stop, window_lines))
+                    windows = [w for w in np.split(order, edges[1:]) if len(w) > 0]
+
+                for window in windows:
+                    w_lines, w_samples = src_lines[window], src_samples[window]
+                    w_line_start, w_sample_start = w_lines.min(), w_samples.min()
+                    w_sample_stop = w_samples.max() + 1
+                    src = read_lines(img_dat, w_line_start, w_lines.max() + 1,
+                                     samples=slice(w_sample_start, w_sample_stop), bands=bands).reshape((-1, nbands))
+                    local_index = (w_lines - w_line_start) * (w_sample_stop - w_sample_start) + \
+                                  w_samples - w_sample_start
+                    flat_out[out_index[window], :] = src[local_index, :]
+
+            yield start, outdat
+
+    def apply_blocked(self, img_dat, out_dat, block_lines=None, max_memory_mb=512, interleave='bip', bands=None):
+        """Orthorectify an image in blocks of GLT rows, writing directly to the output.  See iter_blocks.
+
+        Args:
+            img_dat (array like): raw input image (downtrack, crosstrack[, bands]), sliceable along the first axis
+            out_dat (array like): writable output in its native interleave, e.g. an ENVI memmap
+            block_lines (int, optional): GLT rows per block.  Defaults to None, derived from max_memory_mb.
+            max_memory_mb (float, optional): approximate memory budget per block in MB. Defaults to 512.
+            interleave (str, optional): interleave of out_dat, see write_bip_block. Defaults to 'bip'.
+            bands (array like, optional): band indices to read from a 3d img_dat. Defaults to None, all bands.
+
+        Returns:
+            None
+        """
+        for start, outdat in self.iter_blocks(img_dat, block_lines=block_lines, max_memory_mb=max_memory_mb,
+                                              bands=bands):
+            write_bip_block(out_dat, outdat, start, interleave=interleave)
+
+
 def single_image_ortho(img_dat, glt, glt_nodata_value=0):
     """Orthorectify a single image
 
@@ -36,21 +383,718 @@ def single_image_ortho(img_dat, glt, glt_nodata_value=0):
     Returns:
         array like: orthorectified version of img_dat
     """
-    outdat = np.zeros((glt.shape[0], glt.shape[1], img_dat.shape[-1]))
-    valid_glt = np.all(glt != glt_nodata_value, axis=-1)
-    glt[valid_glt] -= 1 # account for 1-based indexing
-    outdat[valid_glt, :] = img_dat[glt[valid_glt, 1], glt[valid_glt, 0], :]
-    return outdat
+    glt_index = GltIndex.from_glt(glt, img_dat.shape[:2], glt_nodata_value=glt_nodata_value)
+    return glt_index.apply(img_dat, dtype=np.float64)
 
 
-def main(rawargs=None):
+def ortho_block_lines(ortho_samples, nbands, itemsize, max_memory_mb=512):
+    """Determine how many GLT rows to process per block given a memory budget
+
+    Args:
+        ortho_samples (int): number of samples (columns) in the GLT
+        nbands (int): number of bands in the image being orthorectified
+        itemsize (int): bytes per element of the image being orthorectified
+        max_memory_mb (float, optional): approximate memory budget per block in MB. Defaults to 512.
+
+    Returns:
+        int: number of GLT rows per block (at least 1)
+    """
+    # output rows take half the budget; source reads are split into windows that fit the other half
+    row_bytes = 2 * ortho_samples * nbands * itemsize
+    return max(1, int(max_memory_mb * 1024**2 // row_bytes))
+
+
+def single_image_ortho_blocked(img_dat, glt, out_dat, block_lines=None, max_memory_mb=512, glt_nodata_value=0):
+    """Orthorectify a single image in blocks of GLT rows, writing directly to the output.
+    See GltIndex.apply_blocked.
+
+    Args:
+        img_dat (array like): raw input image (downtrack, crosstrack[, bands]), sliceable along the first axis
+        glt (array like): glt - 2 band 1-based indexing for output file(x, y).  Not modified.
+        out_dat (array like): writable output (ortho_y, ortho_x, bands), e.g. a bip ENVI memmap
+        block_lines (int, optional): GLT rows per block.  Defaults to None, derived from max_memory_mb.
+        max_memory_mb (float, optional): approximate memory budget per block in MB. Defaults to 512.
+        glt_nodata_value (int, optional): Value from glt to ignore. Defaults to 0.
+
+    Returns:
+        None
+    """
+    glt_index = GltIndex.from_glt(glt, img_dat.shape[:2], glt_nodata_value=glt_nodata_value)
+    glt_index.apply_blocked(img_dat, out_dat, block_lines=block_lines, max_memory_mb=max_memory_mb)
+
+
+def read_lines(img_dat, line_start, line_stop, samples=None, bands=None):
+    """Read a hyperslab of downtrack lines, so only the requested samples and bands are decompressed
+
+    Args:
+        img_dat (array like): netCDF4 variable or array (downtrack, crosstrack[, bands])
+        line_start (int): first line to read
+        line_stop (int): line to stop reading at (exclusive)
+        samples (slice, optional): crosstrack samples to read. Defaults to None, all samples.
+        bands (array like, optional): band indices to read from a 3d img_dat. Defaults to None, all bands.
+
+    Returns:
+        array like: (lines, samples, bands) array
+    """
+    samples = slice(None) if samples is None else samples
+    if len(img_dat.shape) < 3:
+        dat = np.asarray(img_dat[line_start:line_stop, samples])
+        return dat.reshape((dat.shape[0], dat.shape[1], 1))
+    if bands is None:
+        return np.asarray(img_dat[line_start:line_stop, samples, :])
+    return np.asarray(img_dat[line_start:line_stop, samples, bands])
+
+
+def downtrack_slab_lines(nc_var, max_memory_mb=512):
+    """Determine how many downtrack lines to read per slab, aligned to the variable's chunk layout
+
+    Args:
+        nc_var (netCDF4.Variable): variable to read, with downtrack as the first dimension
+        max_memory_mb (float, optional): approximate memory budget per slab in MB. Defaults to 512.
+
+    Returns:
+        int: lines per slab - a multiple of the downtrack chunk size, and at least one chunk
+    """
+    chunking = nc_var.chunking()
+    chunk_lines = 1 if chunking == 'contiguous' else chunking[0]
+    line_bytes = int(np.prod(nc_var.shape[1:])) * nc_var.dtype.itemsize
+    lines = int(max_memory_mb * 1024**2 // max(line_bytes, 1))
+    return max(chunk_lines, lines // chunk_lines * chunk_lines)
+
+
+def tune_chunk_cache(nc_var, slab_lines):
+    """Size the variable's HDF5 chunk cache to hold every chunk touched by one downtrack slab,
+    so no chunk is decompressed more than once while reading slab by slab
+
+    Args:
+        nc_var (netCDF4.Variable): variable to read, with downtrack as the first dimension
+        slab_lines (int): lines per slab
+
+    Returns:
+        None
+    """
+    chunking = nc_var.chunking()
+    if chunking == 'contiguous':
+        return
+    n_chunks = int(np.ceil(slab_lines / chunking[0]))
+    for dim_size, chunk_size in zip(nc_var.shape[1:], chunking[1:]):
+        n_chunks *= int(np.ceil(dim_size / chunk_size))
+    chunk_bytes = int(np.prod(chunking)) * nc_var.dtype.itemsize
+    # hash table slots should comfortably exceed the number of cached chunks; fully read chunks go first
+    nc_var.set_var_chunk_cache(size=n_chunks * chunk_bytes, nelems=max(1009, 10 * n_chunks + 1), preemption=1.0)
+
+
+def iter_downtrack_slabs(nc_var, max_memory_mb=512, lines=None, samples=None, bands=None):
+    """Read a variable in chunk-aligned downtrack slabs
+
+    Args:
+        nc_var (netCDF4.Variable): variable to read, (downtrack, crosstrack[, bands])
+        max_memory_mb (float, optional): approximate memory budget per slab in MB. Defaults to 512.
+        lines (slice, optional): downtrack lines to read. Defaults to None, all lines.
+        samples (slice, optional): crosstrack samples to read. Defaults to None, all samples.
+        bands (array like, optional): band indices to read from a 3d variable. Defaults to None, all bands.
+
+    Yields:
+        tuple: (start line, stop line, slab array of shape (lines, samples, bands)), with lines relative to
+               the start of the requested lines
+    """
+    line_start, line_stop, _ = (slice(None) if lines is None else lines).indices(nc_var.shape[0])
+    slab_lines = downtrack_slab_lines(nc_var, max_memory_mb)
+    tune_chunk_cache(nc_var, slab_lines)
+
+    # slab_lines is a multiple of the chunk size, so interior slab edges fall on chunk boundaries
+    edges = [line_start] + list(range((line_start // slab_lines + 1) * slab_lines, line_stop, slab_lines)) + [line_stop]
+
+    # masking would only be discarded on write, so skip building it
+    auto_mask = nc_var.mask
+    nc_var.set_auto_mask(False)
+    try:
+        for start, stop in zip(edges[:-1], edges[1:]):
+            slab = read_lines(nc_var, start, stop, samples=samples, bands=bands)
+            yield start - line_start, stop - line_start, slab
+    finally:
+        nc_var.set_auto_mask(auto_mask)
+
+
+def copy_variable(nc_var, out_dat, max_memory_mb=512, interleave='bip', lines=None, samples=None, bands=None):
+    """Stream a variable into a writable output in chunk-aligned downtrack slabs
+
+    Args:
+        nc_var (netCDF4.Variable): variable to read, (downtrack, crosstrack[, bands])
+        out_dat (array like): writable output in its native interleave, e.g. an ENVI memmap
+        max_memory_mb (float, optional): approximate memory budget per slab in MB. Defaults to 512.
+        interleave (str, optional): interleave of out_dat, see write_bip_block. Defaults to 'bip'.
+        lines (slice, optional): downtrack lines to copy. Defaults to None, all lines.
+        samples (slice, optional): crosstrack samples to copy. Defaults to None, all samples.
+        bands (array like, optional): band indices to copy from a 3d variable. Defaults to None, all bands.
+
+    Returns:
+        None
+    """
+    for start, stop, slab in iter_downtrack_slabs(nc_var, max_memory_mb=max_memory_mb, lines=lines,
+                                                  samples=samples, bands=bands):
+        write_bip_block(out_dat, slab, start, interleave=interleave)
+
+
+def parse_bands(band_str, wavelengths=None):
+    """Parse a band selection into band indices
+
+    Args:
+        band_str (str): comma separated list of band indices (5), end-exclusive index ranges (10:20),
+                        and/or inclusive wavelength ranges in nm (400nm:700nm)
+        wavelengths (array like, optional): band center wavelengths, required for wavelength ranges
+
+    Returns:
+        array like: sorted, unique band indices
+    """
+    bands = []
+    for entry in band_str.split(','):
+        entry = entry.strip()
+        if entry.endswith('nm'):
+            if wavelengths is None:
+                raise AttributeError(f'Band selection {entry} requires wavelengths in sensor_band_parameters')
+            low, high = [float(x.strip().removesuffix('nm')) for x in entry.split(':')]
+            bands.extend(np.where(np.logical_and(wavelengths >= low, wavelengths <= high))[0].tolist())
+        elif ':' in entry:
+            start, stop = [int(x) for x in entry.split(':')]
+            bands.extend(range(start, stop))
+        else:
+            bands.append(int(entry))
+    bands = np.unique(bands)
+    if len(bands) == 0:
+        raise AttributeError(f'Band selection {band_str} does not include any bands')
+    return bands
+
+
+def bbox_to_window(geotransform, bbox, shape):
+    """Convert a map-space bounding box to the window of a grid that covers it
+
+    Args:
+        geotransform (array like): GDAL style geotransform of the grid
+        bbox (array like): min x, min y, max x, max y in map coordinates (e.g. min lon, min lat, max lon, max lat)
+        shape (tuple): (rows, columns) of the grid
+
+    Returns:
+        tuple: (row slice, column slice), clipped to the grid
+    """
+    min_x, min_y, max_x, max_y = bbox
+    # round off floating point noise, so edges that fall on pixel boundaries don't pick up an extra pixel
+    col_start = int(np.floor(np.round((min_x - geotransform[0]) / geotransform[1], 6)))
+    col_stop = int(np.ceil(np.round((max_x - geotransform[0]) / geotransform[1], 6)))
+    row_start = int(np.floor(np.round((max_y - geotransform[3]) / geotransform[5], 6)))
+    row_stop = int(np.ceil(np.round((min_y - geotransform[3]) / geotransform[5], 6)))
+
+    rows = slice(max(row_start, 0), min(row_stop, shape[0]))
+    cols = slice(max(col_start, 0), min(col_stop, shape[1]))
+    if rows.start >= rows.stop or cols.start >= cols.stop:
+        raise AttributeError(f'Bounding box {bbox} does not overlap the grid')
+    return rows, cols
+
+
+def get_subset(nc_ds, ds, args):
+    """Resolve the --bands and (swath) --window selections for a variable
+
+    Args:
+        nc_ds (netCDF4.Dataset): open input netCDF
+        ds (str): name of the root variable to convert
+        args (argparse.Namespace): parsed reformat arguments
+
+    Returns:
+        tuple: (line slice, sample slice, band indices or None for all bands)
+    """
+    nc_var = nc_ds[ds]
+    lines, samples = slice(0, nc_var.shape[0]), slice(0, nc_var.shape[1])
+    if args.window is not None and not args.orthorectify:
+        line_start, line_stop, sample_start, sample_stop = [int(x) for x in args.window]
+        lines = slice(*slice(line_start, line_stop).indices(nc_var.shape[0])[:2])
+        samples = slice(*slice(sample_start, sample_stop).indices(nc_var.shape[1])[:2])
+
+    bands = None
+    if args.bands is not None and len(nc_var.shape) > 2:
+        wavelengths = None
+        if "sensor_band_parameters" in nc_ds.groups:
+            for bp in ['wavelengths', 'radiance_wl']:
+                if bp in nc_ds['sensor_band_parameters'].variables:
+                    wavelengths = np.array(nc_ds['sensor_band_parameters'].variables[bp])
+        bands = parse_bands(args.bands, wavelengths)
+        if bands[-1] >= nc_var.shape[2] or bands[0] < 0:
+            raise AttributeError(f'Band selection {args.bands} is out of range for {ds}')
+    return lines, samples, bands
+
+
+def output_path(args, ds, ext=''):
+    """Get the output path for a variable, checking against existing files
+
+    Args:
+        args (argparse.Namespace): parsed reformat arguments
+        ds (str): name of the variable being converted
+        ext (str, optional): extension to add to the output path. Defaults to ''.
+
+    Returns:
+        str: output path
+    """
+    output_name = os.path.join(args.output_dir, os.path.splitext(os.path.basename(args.input_netcdf))[0] + '_' + ds + ext)
+    if os.path.exists(output_name) and args.overwrite is False:
+        err_str = f'File {output_name} already exists. Please use --overwrite to replace'
+        raise AttributeError(err_str)
+    return output_name
+
+
+def build_metadata(nc_ds, ds, args, glt_index=None):
+    """Build the ENVI header metadata for a variable
+
+    Args:
+        nc_ds (netCDF4.Dataset): open input netCDF
+        ds (str): name of the root variable to convert
+        args (argparse.Namespace): parsed reformat arguments
+        glt_index (GltIndex, optional): precomputed GLT index, required if args.orthorectify is set
+
+    Returns:
+        dict: ENVI header metadata
+    """
+    lines, samples, bands = get_subset(nc_ds, ds, args)
+    nbands = 1
+    if len(nc_ds[ds].shape) > 2:
+        nbands = nc_ds[ds].shape[2]
+
+    metadata = {
+        'lines': lines.stop - lines.start,
+        'samples': samples.stop - samples.start,
+        'bands': nbands if bands is None else len(bands),
+        'interleave': args.interleave,
+        'header offset' : 0,
+        'file type' : 'ENVI Standard',
+        'data type' : envi_typemap[str(nc_ds[ds].dtype)],
+        'byte order' : 0
+    }
+
+    for key in list(nc_ds.__dict__.keys()):
+        if key == 'summary':
+            metadata['description'] = nc_ds.__dict__[key]
+        elif key not in ['geotransform','spatial_ref' ]:
+            metadata[key] = f'{{ {nc_ds.__dict__[key]} }}'
+
+    if args.orthorectify:
+        metadata['lines'] = glt_index.shape[0]
+        metadata['samples'] = glt_index.shape[1]
+        gt = np.array(nc_ds.__dict__["geotransform"])
+        ul_x = gt[0] + glt_index.offset[1] * gt[1]
+        ul_y = gt[3] + glt_index.offset[0] * gt[5]
+        metadata['map info'] = f'{{Geographic Lat/Lon, 1, 1, {ul_x}, {ul_y}, {gt[1]}, {gt[5]*-1},WGS-84}}'
+
+        metadata['coordinate system string'] = f'{{ {nc_ds.__dict__["spatial_ref"]} }}'
+
+    if ("sensor_band_parameters" in nc_ds.groups):
+        band_parameters = nc_ds['sensor_band_parameters'].variables.keys()
+        for bp in band_parameters:
+            if bp == 'wavelengths' or bp == 'radiance_wl':
+                metadata['wavelength'] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
+            elif bp == 'radiance_fwhm':
+                metadata['fwhm'] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
+            elif bp == 'observation_bands':
+                metadata['band names'] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
+            else:
+                metadata[bp] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
+
+    if 'wavelength' in list(metadata.keys()) and 'band names' not in list(metadata.keys()):
+        metadata['band names'] = metadata['wavelength']
+
+    if bands is not None:
+        for key, value in metadata.items():
+            if isinstance(value, list) and len(value) == nbands:
+                metadata[key] = [value[b] for b in bands]
+
+    return metadata
+
+
+def export_variable(nc_ds, ds, args, glt_index=None):
+    """Convert a single netCDF variable to an ENVI file
+
+    Args:
+        nc_ds (netCDF4.Dataset): open input netCDF
+        ds (str): name of the root variable to convert
+        args (argparse.Namespace): parsed reformat arguments
+        glt_index (GltIndex, optional): precomputed GLT index, required if args.orthorectify is set
+
+    Returns:
+        str: output file written, or None if the variable was skipped
+    """
+    output_name = output_path(args, ds)
+    metadata = build_metadata(nc_ds, ds, args, glt_index=glt_index)
+
+    # special case for flat field updat
+    if ds == 'flat_field_update' and args.orthorectify:
+        print(f'{ds} is not something that can be orthorectified - skipping.  If you want this file, rerun without --orthorectify')
+        return None
+
+    envi_ds = envi.create_image(envi_header(output_name), metadata, ext='', force=args.overwrite)
+    mm = envi_ds.open_memmap(interleave='source',writable=True)
+
+    lines, samples, bands = get_subset(nc_ds, ds, args)
+    if args.orthorectify:
+        glt_index.apply_blocked(nc_ds[ds], mm, block_lines=args.block_lines, max_memory_mb=args.max_memory_mb,
+                                interleave=args.interleave, bands=bands)
+    else:
+        copy_variable(nc_ds[ds], mm, max_memory_mb=args.max_memory_mb, interleave=args.interleave,
+                      lines=lines, samples=samples, bands=bands)
+    del mm, envi_ds
+    return output_name
+
+
+def _metadata_value(value):
+    # unwrap the ENVI '{ value }' formatting
+    return str(value).removeprefix('{ ').removesuffix(' }')
+
+
+def _add_vrt_attribute(parent, name, value):
+    attribute = ET.SubElement(parent, 'Attribute', name=name)
+    ET.SubElement(attribute, 'DataType').text = 'String'
+    if not isinstance(value, list):
+        value = [_metadata_value(value)]
+    for val in value:
+        ET.SubElement(attribute, 'Value').text = str(val)
+
+
+def _add_vrt_array(group, name, source_filename, nc_var, dimension_names, transpose=None, srs=None):
+    array = ET.SubElement(group, 'Array', name=name)
+    ET.SubElement(array, 'DataType').text = gdal_typemap[str(nc_var.dtype)]
+    for dim in dimension_names:
+        ET.SubElement(array, 'DimensionRef', ref=dim)
+    if srs is not None:
+        # data axis i maps to SRS axis mapping[i]: (ortho_y, ortho_x) is already (lat, lon), the EPSG:4326 axis order
+        ET.SubElement(array, 'SRS', dataAxisToSRSAxisMapping='1,2').text = srs
+    if '_FillValue' in nc_var.ncattrs():
+        ET.SubElement(array, 'NoDataValue').text = str(nc_var.getncattr('_FillValue'))
+
+    source = ET.SubElement(array, 'Source')
+    ET.SubElement(source, 'SourceFilename').text = source_filename
+    ET.SubElement(source, 'SourceArray').text = nc_var.group().path.rstrip('/') + '/' + nc_var.name
+    if transpose is not None:
+        ET.SubElement(source, 'SourceTranspose').text = ','.join([str(x) for x in transpose])
+    return array
+
+
+def export_vrt(nc_ds, ds, args, glt_index=None):
+    """Write a GDAL multidimensional VRT that references a netCDF variable in place, rather than copying it.
+
+    Swath variables (downtrack, crosstrack, bands) are exposed as (bands, downtrack, crosstrack), and carry the
+    same metadata (wavelengths, map info, etc.) as the ENVI header would.  A VRT cannot express the GLT lookup
+    itself, so with --orthorectify the GLT arrays are added alongside the data, on a georeferenced ortho grid
+    (from the geotransform and spatial_ref global attributes), for downstream tools to apply.  Open with
+    gdal.OpenEx(path, gdal.OF_MULTIDIM_RASTER), or gdalmdiminfo / gdalmdimtranslate.
+
+    Args:
+        nc_ds (netCDF4.Dataset): open input netCDF
+        ds (str): name of the root variable to reference
+        args (argparse.Namespace): parsed reformat arguments
+        glt_index (GltIndex, optional): precomputed GLT index, used for the ortho grid if args.orthorectify is set
+
+    Returns:
+        str: output VRT written
+    """
+    output_name = output_path(args, ds, ext='.vrt')
+    metadata = build_metadata(nc_ds, ds, args, glt_index=glt_index)
+    source_filename = os.path.abspath(args.input_netcdf)
+    nc_var = nc_ds[ds]
+
+    dimension_names = list(nc_var.dimensions)
+    transpose = None
+    if len(dimension_names) == 3 and dimension_names[0] == 'downtrack':
+        transpose = [2, 0, 1]
+        dimension_names = [dimension_names[x] for x in transpose]
+
+    vrt = ET.Element('VRTDataset')
+    group = ET.SubElement(vrt, 'Group', name='/')
+    for dim in dimension_names:
+        ET.SubElement(group, 'Dimension', name=dim, size=str(nc_ds.dimensions[dim].size))
+
+    if args.orthorectify:
+        gt = np.array(nc_ds.__dict__["geotransform"])
+        ET.SubElement(group, 'Dimension', name='ortho_y', size=str(glt_index.shape[0]), type='HORIZONTAL_Y',
+                      direction='NORTH', indexingVariable='lat')
+        ET.SubElement(group, 'Dimension', name='ortho_x', size=str(glt_index.shape[1]), type='HORIZONTAL_X',
+                      direction='EAST', indexingVariable='lon')
+        # indexing variables at pixel centers
+        for name, dim, start, increment in [('lat', 'ortho_y', gt[3] + gt[5] / 2., gt[5]),
+                                            ('lon', 'ortho_x', gt[0] + gt[1] / 2., gt[1])]:
+            index_array = ET.SubElement(group, 'Array', name=name)
+            ET.SubElement(index_array, 'DataType').text = 'Float64'
+            ET.SubElement(index_array, 'DimensionRef', ref=dim)
+            ET.SubElement(index_array, 'RegularlySpacedValues', start=str(start), increment=str(increment))
+
+        for glt_name in ['glt_x', 'glt_y']:
+            _add_vrt_array(group, glt_name, source_filename, nc_ds.groups['location'][glt_name],
+                           ['ortho_y', 'ortho_x'], srs=nc_ds.__dict__['spatial_ref'])
+
+    array = _add_vrt_array(group, ds, source_filename, nc_var, dimension_names, transpose=transpose)
+    for key, value in metadata.items():
+        if key not in envi_layout_keys:
+            _add_vrt_attribute(array, key, value)
+
+    ET.indent(vrt)
+    ET.ElementTree(vrt).write(output_name)
+    return output_name
+
+
+gdal_output_formats = {
+    'GTiff': {'ext': '.tif', 'compress': 'DEFLATE'},
+    'Zarr': {'ext': '.zarr', 'compress': 'ZLIB'}
+}
+
+
+def export_gdal(nc_ds, ds, args, glt_index=None):
+    """Convert a single netCDF variable to a tiled, compressed GDAL format (GeoTIFF with overviews, or Zarr).
+    Data is streamed in the same slabs / ortho blocks as the ENVI path, and tiles are compressed on
+    args.threads threads by GDAL.
+
+    Args:
+        nc_ds (netCDF4.Dataset): open input netCDF
+        ds (str): name of the root variable to convert
+        args (argparse.Namespace): parsed reformat arguments
+        glt_index (GltIndex, optional): precomputed GLT index, required if args.orthorectify is set
+
+    Returns:
+        str: output file written, or None if the variable was skipped
+    """
+    output_format = gdal_output_formats[args.output_type]
+    output_name = output_path(args, ds, ext=output_format['ext'])
+    metadata = build_metadata(nc_ds, ds, args, glt_index=glt_index)
+
+    if ds == 'flat_field_update' and args.orthorectify:
+        print(f'{ds} is not something that can be orthorectified - skipping.  If you want this file, rerun without --orthorectify')
+        return None
+
+    nc_var = nc_ds[ds]
+    dtype = np.dtype(nc_var.dtype)
+    gdal_type = gdal.GetDataTypeByName(gdal_typemap[str(dtype)])
+    nbands = metadata['bands']
+    compress = args.compress if args.compress is not None else output_format['compress']
+    num_threads = str(args.threads)
+
+    # Zarr chunks default to 256 x 256 spatial tiles
+    options = [f'COMPRESS={compress}']
+    if args.output_type == 'GTiff':
+        predictor = 3 if dtype.kind == 'f' else 2
+        options += ['TILED=YES', f'BLOCKXSIZE={args.tile_size}', f'BLOCKYSIZE={args.tile_size}', 'BIGTIFF=IF_SAFER',
+                    f'NUM_THREADS={num_threads}', f'PREDICTOR={predictor}',
+                    f'INTERLEAVE={"PIXEL" if args.interleave == "BIP" else "BAND"}']
+
+    if os.path.exists(output_name):
+        gdal.GetDriverByName(args.output_type).Delete(output_name)
+
+    with gdal.config_options({'GDAL_NUM_THREADS': num_threads}):
+        out_ds = gdal.GetDriverByName(args.output_type).Create(output_name, metadata['samples'], metadata['lines'],
+                                                                nbands, gdal_type, options=options)
+
+        lines, samples, bands = get_subset(nc_ds, ds, args)
+        if args.orthorectify:
+            gt = [float(x) for x in nc_ds.__dict__['geotransform']]
+            gt[0] += glt_index.offset[1] * gt[1]
+            gt[3] += glt_index.offset[0] * gt[5]
+            out_ds.SetGeoTransform(gt)
+            out_ds.SetProjection(nc_ds.__dict__['spatial_ref'])
+            blocks = glt_index.iter_blocks(nc_var, block_lines=args.block_lines, max_memory_mb=args.max_memory_mb,
+                                           bands=bands)
+        else:
+            blocks = ((start, slab) for start, _, slab in iter_downtrack_slabs(nc_var, max_memory_mb=args.max_memory_mb,
+                                                                               lines=lines, samples=samples,
+                                                                               bands=bands))
+
+        # per-band metadata only applies to variables that span the sensor bands
+        band_keys = [key for key in ['band names', 'wavelength', 'fwhm'] if len(metadata.get(key, [])) == nbands]
+        fill_value = float(nc_var.getncattr('_FillValue')) if '_FillValue' in nc_var.ncattrs() else None
+        # Zarr (in raster mode) only persists metadata set as one dictionary on the dataset, and multi-band Zarr
+        # bands are views of a single 3d array that cannot take a nodata value - so for Zarr, band metadata and
+        # the fill value go into the dataset dictionary
+        band_level = args.output_type == 'GTiff'
+        ds_metadata = {key: _metadata_value(value) for key, value in metadata.items()
+                       if key not in envi_layout_keys and not isinstance(value, list)}
+        if not band_level:
+            ds_metadata.update({key: ', '.join([str(x) for x in metadata[key]]) for key in band_keys})
+            if fill_value is not None and nbands > 1:
+                ds_metadata['_FillValue'] = str(fill_value)
+        out_ds.SetMetadata(ds_metadata)
+
+        for band in range(nbands):
+            out_band = out_ds.GetRasterBand(band + 1)
+            if band_level:
+                for key in band_keys:
+                    if key == 'band names':
+                        out_band.SetDescription(str(metadata[key][band]))
+                    else:
+                        out_band.SetMetadataItem(key, str(metadata[key][band]))
+            if fill_value is not None and (band_level or nbands == 1):
+                out_band.SetNoDataValue(fill_value)
+
+        for start, block in blocks:
+            block = np.ascontiguousarray(block)
+            out_ds.WriteRaster(0, start, block.shape[1], block.shape[0], block,
+                               buf_type=gdal_type, band_list=list(range(1, nbands + 1)),
+                               buf_pixel_space=nbands * dtype.itemsize,
+                               buf_line_space=block.shape[1] * nbands * dtype.itemsize,
+                               buf_band_space=dtype.itemsize)
+
+        if args.output_type == 'GTiff':
+            levels = []
+            while min(out_ds.RasterXSize, out_ds.RasterYSize) // (2 ** (len(levels) + 1)) >= args.tile_size:
+                levels.append(2 ** (len(levels) + 1))
+            if len(levels) > 0:
+                out_ds.BuildOverviews('NEAREST' if dtype.kind in 'iu' else 'AVERAGE', levels)
+        out_ds = None
+
+    return output_name
+
+
+def extract_aoi(input_netcdf, ds, bbox, bands=None, max_memory_mb=512):
+    """Orthorectify a map-space area of interest from one variable, reading only the GLT window
+    covering the bbox and the swath lines/samples that window references.
+
+    Args:
+        input_netcdf (str): EMIT netCDF to read from
+        ds (str): name of the root variable to extract
+        bbox (array like): min x, min y, max x, max y in map coordinates (e.g. min lon, min lat, max lon, max lat)
+        bands (array like, optional): band indices to extract from a 3d variable. Defaults to None, all bands.
+        max_memory_mb (float, optional): approximate memory budget per block in MB. Defaults to 512.
+
+    Returns:
+        array like: orthorectified (rows, columns, bands) array in the source dtype
+        list: GDAL style geotransform of the returned array
+        str: spatial reference WKT of the returned array
+    """
+    nc_ds = netCDF4.Dataset(input_netcdf, 'r', format='NETCDF4')
+    glt_index = GltIndex.from_netcdf(nc_ds, bbox=bbox)
+
+    nc_var = nc_ds[ds]
+    nbands = 1 if len(nc_var.shape) < 3 else nc_var.shape[2]
+    if bands is not None and len(nc_var.shape) > 2:
+        nbands = len(bands)
+    outdat = np.zeros((glt_index.shape[0], glt_index.shape[1], nbands), dtype=nc_var.dtype)
+    glt_index.apply_blocked(nc_var, outdat, max_memory_mb=max_memory_mb, bands=bands)
+
+    gt = [float(x) for x in nc_ds.__dict__['geotransform']]
+    gt[0] += glt_index.offset[1] * gt[1]
+    gt[3] += glt_index.offset[0] * gt[5]
+    spatial_ref = nc_ds.__dict__['spatial_ref']
+    nc_ds.close()
+    return outdat, gt, spatial_ref
+
+
+# per-process state for parallel exports, populated by _init_export_worker
+_worker_state = {}
+
+
+def _init_export_worker(input_netcdf, glt_index):
+    _worker_state['nc_ds'] = netCDF4.Dataset(input_netcdf, 'r', format='NETCDF4')
+    _worker_state['glt_index'] = glt_index
+
+
+def _export_variable_worker(ds, args):
+    try:
+        export(_worker_state['nc_ds'], ds, args, glt_index=_worker_state['glt_index'])
+    except Exception:
+        return ds, traceback.format_exc()
+    return ds, None
+
+
+def _split_threads(threads, workers):
+    """Share a --threads value (a number, or ALL_CPUS) between worker processes, at least one thread each"""
+    total = os.cpu_count() if str(threads).upper() == 'ALL_CPUS' else int(threads)
+    return str(max(1, total // workers))
+
+
+def export_variables_parallel(dataset_names, args, glt_index=None, workers=2):
+    """Convert several netCDF variables on a process pool, in args.output_type.  Each worker opens its own
+    read-only handle to args.input_netcdf, and GDAL formats get an even share of args.threads per worker.
+
+    Args:
+        dataset_names (list): names of the root variables to convert
+        args (argparse.Namespace): parsed reformat arguments
+        glt_index (GltIndex, optional): precomputed GLT index, required if args.orthorectify is set
+        workers (int, optional): number of worker processes. Defaults to 2.
+
+    Returns:
+        dict: variable name to formatted traceback (or None on success), in dataset_names order
+    """
+    if args.output_type in gdal_output_formats:
+        args = argparse.Namespace(**vars(args))
+        args.threads = _split_threads(args.threads, workers)
+    ctx = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_export_worker,
+                             initargs=(args.input_netcdf, glt_index)) as executor:
+        results = dict(executor.map(_export_variable_worker, dataset_names, [args] * len(dataset_names)))
+    return {ds: results[ds] for ds in dataset_names}
+
+
+def build_parser():
+    """Build the reformat argument parser
+
+    Returns:
+        argparse.ArgumentParser: parser for reformat arguments
+    """
     parser = argparse.ArgumentParser(description="Apply OE to a block of data.")
     parser.add_argument('input_netcdf', type=str, help='File to convert.')
     parser.add_argument('output_dir', type=str, help='Base directory for output ENVI files')
-    parser.add_argument('-ot', '--output_type', type=str, default='ENVI', choices=['ENVI'], help='Output format')
+    parser.add_argument('-ot', '--output_type', type=str, default='ENVI', choices=['ENVI', 'VRT'] + list(gdal_output_formats.keys()), help='Output format')
     parser.add_argument('--interleave', type=str, default='BIL', choices=['BIL','BIP','BSQ'], help='Interleave of ENVI file to write')
     parser.add_argument('--overwrite', action='store_true', help='Overwrite existing file')
     parser.add_argument('--orthorectify', action='store_true', help='Orthorectify data')
+    parser.add_argument('--glt_cache', type=str, default=None, help='.npy GLT index cache to reuse (or create) across products of the same scene (.npy is appended if missing)')
+    parser.add_argument('--block_lines', type=int, default=None, help='GLT rows per orthorectification block (overrides --max_memory_mb)')
+    parser.add_argument('--max_memory_mb', type=float, default=512, help='Approximate memory budget per block or slab read, in MB')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes to convert variables with (GTiff/Zarr split --threads between them)')
+    parser.add_argument('--threads', type=str, default='ALL_CPUS', help='Threads GDAL compresses GTiff/Zarr tiles with: a number, or ALL_CPUS')
+    parser.add_argument('--compress', type=str, default=None, help='GTiff/Zarr compression (defaults to DEFLATE for GTiff, ZLIB for Zarr)')
+    parser.add_argument('--tile_size', type=int, default=256, help='GTiff tile size, in pixels')
+    parser.add_argument('--variables', type=str, nargs='+', default=None, help='Root variables to convert (default all)')
+    parser.add_argument('--bands', type=str, default=None,
+                        help='Bands to convert: comma separated indices (5), end-exclusive index ranges (10:20), '
+                             'and/or inclusive wavelength ranges (400nm:700nm)')
+    parser.add_argument('--window', type=float, nargs=4, default=None,
+                        help='Spatial window to convert: LINE_START LINE_STOP SAMPLE_START SAMPLE_STOP (end-exclusive), '
+                             'or with --orthorectify, MIN_LON MIN_LAT MAX_LON MAX_LAT')
+    return parser
+
+
+def select_variables(nc_ds, args):
+    """Get the root variables to convert, honoring --variables
+
+    Args:
+        nc_ds (netCDF4.Dataset): open input netCDF
+        args (argparse.Namespace): parsed reformat arguments
+
+    Returns:
+        list: variable names, in file order
+    """
+    dataset_names = list(nc_ds.variables.keys())
+    if args.variables is not None:
+        missing = [ds for ds in args.variables if ds not in dataset_names]
+        if len(missing) > 0:
+            raise AttributeError(f'Variables {missing} not found in {args.input_netcdf}')
+        dataset_names = [ds for ds in dataset_names if ds in args.variables]
+    return dataset_names
+
+
+def export(nc_ds, ds, args, glt_index=None):
+    """Convert a single netCDF variable to args.output_type
+
+    Args:
+        nc_ds (netCDF4.Dataset): open input netCDF
+        ds (str): name of the root variable to convert
+        args (argparse.Namespace): parsed reformat arguments
+        glt_index (GltIndex, optional): precomputed GLT index, required if args.orthorectify is set
+
+    Returns:
+        str: output written, or None if the variable was skipped
+    """
+    if args.output_type == 'VRT':
+        return export_vrt(nc_ds, ds, args, glt_index=glt_index)
+    elif args.output_type in gdal_output_formats:
+        return export_gdal(nc_ds, ds, args, glt_index=glt_index)
+    return export_variable(nc_ds, ds, args, glt_index=glt_index)
+
+
+def main(rawargs=None):
+    parser = build_parser()
     args = parser.parse_args(rawargs)
 
     nc_ds = netCDF4.Dataset(args.input_netcdf, 'r', format='NETCDF4')
@@ -59,79 +1103,27 @@ def main(rawargs=None):
         err_str = f'Output directory {args.output_dir} does not exist - please create or try again'
         raise AttributeError(err_str)
 
-    if args.orthorectify:
-        glt = np.zeros(list(nc_ds.groups['location']['glt_x'].shape) + [2], dtype=np.int32)
-        glt[...,0] = np.array(nc_ds.groups['location']['glt_x'])
-        glt[...,1] = np.array(nc_ds.groups['location']['glt_y'])
-
-    if args.output_type == 'ENVI':
-        dataset_names = list(nc_ds.variables.keys())
-        for ds in dataset_names:
-            output_name = os.path.join(args.output_dir, os.path.splitext(os.path.basename(args.input_netcdf))[0] + '_' + ds)
-            if os.path.isfile(output_name) and args.overwrite is False:
-                err_str = f'File {output_name} already exists. Please use --overwrite to replace'
-                raise AttributeError(err_str)
-            nbands = 1
-            if len(nc_ds[ds].shape) > 2:
-                nbands = nc_ds[ds].shape[2]
-
-            metadata = {
-                'lines': nc_ds[ds].shape[0],
-                'samples': nc_ds[ds].shape[1],
-                'bands': nbands,
-                'interleave': args.interleave,
-                'header offset' : 0,
-                'file type' : 'ENVI Standard',
-                'data type' : envi_typemap[str(nc_ds[ds].dtype)],
-                'byte order' : 0
-            }
-
-            for key in list(nc_ds.__dict__.keys()):
-                if key == 'summary':
-                    metadata['description'] = nc_ds.__dict__[key]
-                elif key not in ['geotransform','spatial_ref' ]:
-                    metadata[key] = f'{{ {nc_ds.__dict__[key]} }}'
-
-            if args.orthorectify:
-                metadata['lines'] = glt.shape[0]
-                metadata['samples'] = glt.shape[1]
-                gt = np.array(nc_ds.__dict__["geotransform"])
-                metadata['map info'] = f'{{Geographic Lat/Lon, 1, 1, {gt[0]}, {gt[3]}, {gt[1]}, {gt[5]*-1},WGS-84}}'
-
-                metadata['coordinate system string'] = f'{{ {nc_ds.__dict__["spatial_ref"]} }}'
-
-            if ("sensor_band_parameters" in nc_ds.groups):
-                band_parameters = nc_ds['sensor_band_parameters'].variables.keys()
-                for bp in band_parameters:
-                    if bp == 'wavelengths' or bp == 'radiance_wl':
-                        metadata['wavelength'] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
-                    elif bp == 'radiance_fwhm':
-                        metadata['fwhm'] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
-                    elif bp == 'observation_bands':
-                        metadata['band names'] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
-                    else:
-                        metadata[bp] = np.array(nc_ds['sensor_band_parameters'].variables[bp]).astype(str).tolist()
-
-            if 'wavelength' in list(metadata.keys()) and 'band names' not in list(metadata.keys()):
-                metadata['band names'] = metadata['wavelength']
+    if args.output_type == 'VRT' and (args.bands is not None or args.window is not None):
+        raise AttributeError('--bands and --window are not supported for VRT output')
 
-            # special case for flat field updat
-            if ds == 'flat_field_update' and args.orthorectify:
-                print(f'{ds} is not something that can be orthorectified - skipping.  If you want this file, rerun without --orthorectify')
-                continue
-
-            dat = np.array(nc_ds[ds])
-            if len(dat.shape) == 2:
-                dat = dat.reshape((dat.shape[0],dat.shape[1],1))
+    glt_index = None
+    if args.orthorectify:
+        glt_index = GltIndex.from_netcdf(nc_ds, cache_file=args.glt_cache, bbox=args.window)
 
-            envi_ds = envi.create_image(envi_header(output_name), metadata, ext='', force=args.overwrite)
-            mm = envi_ds.open_memmap(interleave='bip',writable=True)
+    dataset_names = select_variables(nc_ds, args)
 
-            if args.orthorectify:
-                mm[...] = single_image_ortho(dat, glt)
-            else:
-                mm[...] = np.array(dat)
-            del mm, envi_ds
+    if args.workers > 1 and len(dataset_names) > 1:
+        nc_ds.close()
+        errors = export_variables_parallel(dataset_names, args, glt_index=glt_index,
+                                           workers=min(args.workers, len(dataset_names)))
+        failed = [ds for ds, err in errors.items() if err is not None]
+        for ds in failed:
+            logging.error(f'Failed to convert {ds}:\n{errors[ds]}')
+        if len(failed) > 0:
+            raise RuntimeError(f'Failed to convert variables: {", ".join(failed)} - check logs for details')
+    else:
+        for ds in dataset_names:
+            export(nc_ds, ds, args, glt_index=glt_index)
 
 
 if __name__ == "__main__":
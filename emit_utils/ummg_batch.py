@@ -0,0 +1,193 @@
+"""
+Build, validate and write UMMG metadata for many granules at once, e.g. for a reprocessing campaign or a
+metadata-only redelivery of a collection.
+
+The manifest is JSON lines (or a JSON list), one granule per entry:
+    {"output": "/out/EMIT_L2A_RFL_..._001.cmr.json",
+     "initialize": {"granule_name": "...", "creation_time": "2024-01-01T00:00:00Z", ... initialize_ummg arguments},
+     "data_files": ["/out/EMIT_L2A_RFL_..._001.nc"], "file_formats": ["NETCDF-4"], "daynight": "Day",
+     "glt_file": "/store/..._glt"  or  "boundary": [[lon, lat], ...],
+     "related_urls": [{"url": "...", "url_type": "...", "description": "...", "url_subtype": "..."}]}
+Only "output" and "initialize" are required.  Datetime arguments of initialize_ummg are ISO 8601 strings.
+
+    python emit_utils/ummg_batch.py manifest.jsonl --workers 32 --checksum_cache checksums.sqlite
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from emit_utils import daac_converter
+from emit_utils.checksums import ChecksumCache
+from emit_utils.footprint import glt_footprint
+
+_datetime_arguments = ['creation_time', 'start_time', 'stop_time']
+_max_error_examples = 5
+
+# per-process state, set by _init_worker
+_worker_state = {}
+
+
+def read_manifest(manifest_file: str):
+    """
+    Read a granule manifest
+    Args:
+        manifest_file: JSON lines file, or a JSON file holding a list, of granule entries
+
+    Returns:
+        list: granule entries (dicts)
+    """
+    with open(manifest_file, 'r') as fin:
+        content = fin.read()
+    if content.lstrip().startswith('['):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip() != '']
+
+
+def build_ummg(spec: dict, checksum_cache: ChecksumCache = None, verify_checksums: bool = False):
+    """
+    Build the UMMG for one manifest entry
+    Args:
+        spec: manifest entry
+        checksum_cache: optional ChecksumCache for the data file checksums
+        verify_checksums: if True, rehash data files even when cached
+
+    Returns:
+        dict: UMMG
+    """
+    init_args = dict(spec['initialize'])
+    for key in _datetime_arguments:
+        if isinstance(init_args.get(key), str):
+            init_args[key] = datetime.fromisoformat(init_args[key].replace('Z', '+00:00'))
+    ummg = daac_converter.initialize_ummg(**init_args)
+
+    if 'data_files' in spec:
+        file_formats = spec.get('file_formats', ['NETCDF-4'] * len(spec['data_files']))
+        ummg = daac_converter.add_data_files_ummg(ummg, spec['data_files'], spec['daynight'], file_formats,
+                                                  checksum_cache=checksum_cache, verify_checksums=verify_checksums)
+
+    if 'boundary' in spec:
+        ummg = daac_converter.add_boundary_ummg(ummg, spec['boundary'])
+    elif 'glt_file' in spec:
+        ummg = daac_converter.add_boundary_ummg(ummg, glt_footprint(spec['glt_file']).boundary)
+
+    for related_url in spec.get('related_urls', []):
+        ummg.setdefault('RelatedUrls', [])
+        ummg = daac_converter.add_related_url(ummg, related_url['url'], related_url['url_type'],
+                                              description=related_url.get('description'),
+                                              url_subtype=related_url.get('url_subtype'))
+    return ummg
+
+
+def _init_worker(checksum_cache_file, verify_checksums, validate_only, fsync):
+    _worker_state['checksum_cache'] = None if checksum_cache_file is None else ChecksumCache(checksum_cache_file)
+    _worker_state['verify_checksums'] = verify_checksums
+    _worker_state['validate_only'] = validate_only
+    _worker_state['fsync'] = fsync
+
+
+def _process_granule(spec):
+    start = time.perf_counter()
+    output = spec.get('output')
+    try:
+        ummg = build_ummg(spec, checksum_cache=_worker_state['checksum_cache'],
+                          verify_checksums=_worker_state['verify_checksums'])
+        if _worker_state['validate_only']:
+            errors = daac_converter.check_ummg(ummg)
+        else:
+            errors = daac_converter.write_ummg(output, ummg, fsync=_worker_state['fsync'])
+        status = 'invalid' if len(errors) > 0 else 'ok'
+    except Exception as e:
+        errors = [f'{type(e).__name__}: {e}']
+        status = 'failed'
+    return output, status, errors, time.perf_counter() - start
+
+
+def _error_category(error):
+    # group the same error across granules and list items: ummg.X[3].Y: ... -> ummg.X[*].Y: ...
+    return re.sub(r'\[\d+\]', '[*]', error)
+
+
+def batch_ummg(specs: list, workers: int = 1, checksum_cache_file: str = None, verify_checksums: bool = False,
+               validate_only: bool = False, fsync: bool = False, chunksize: int = 32):
+    """
+    Build, validate and (atomically) write UMMG for many granules on a process pool.  Invalid granules are not
+    written.
+    Args:
+        specs: manifest entries, see read_manifest
+        workers: number of worker processes
+        checksum_cache_file: optional SQLite ChecksumCache shared by all workers
+        verify_checksums: if True, rehash data files even when cached
+        validate_only: build and validate, but do not write
+        fsync: fsync each UMMG before renaming it into place
+        chunksize: granules sent to a worker at a time
+
+    Returns:
+        dict: summary with counts, timing, aggregated error categories (count and example outputs), and
+              per-granule errors for granules that were not written
+    """
+    summary = {'granules': len(specs), 'ok': 0, 'invalid': 0, 'failed': 0, 'seconds': None,
+               'error_categories': {}, 'granule_errors': {}}
+    init_args = (checksum_cache_file, verify_checksums, validate_only, fsync)
+
+    start = time.perf_counter()
+    if workers > 1:
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=init_args) as executor:
+            results = list(executor.map(_process_granule, specs, chunksize=max(1, chunksize)))
+    else:
+        _init_worker(*init_args)
+        results = [_process_granule(spec) for spec in specs]
+
+    for output, status, errors, _ in results:
+        summary[status] += 1
+        if len(errors) == 0:
+            continue
+        summary['granule_errors'][output] = errors
+        for category in sorted(set([_error_category(e) for e in errors])):
+            entry = summary['error_categories'].setdefault(category, {'count': 0, 'examples': []})
+            entry['count'] += 1
+            if len(entry['examples']) < _max_error_examples:
+                entry['examples'].append(output)
+    summary['seconds'] = time.perf_counter() - start
+
+    logging.info(f'UMMG for {len(specs)} granules in {summary["seconds"]:.1f} s: {summary["ok"]} ok, '
+                 f'{summary["invalid"]} invalid, {summary["failed"]} failed')
+    return summary
+
+
+def main(rawargs=None):
+    parser = argparse.ArgumentParser(description='Build, validate and write UMMG for a manifest of granules')
+    parser.add_argument('manifest', type=str, help='JSON lines (or JSON list) manifest of granules')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('--checksum_cache', type=str, default=None, help='SQLite checksum cache file')
+    parser.add_argument('--verify_checksums', action='store_true', help='Rehash data files even when cached')
+    parser.add_argument('--validate_only', action='store_true', help='Validate without writing UMMG files')
+    parser.add_argument('--fsync', action='store_true', help='fsync each UMMG file before renaming into place')
+    parser.add_argument('--summary', type=str, default=None, help='JSON summary output (default manifest + .summary.json)')
+    parser.add_argument('--log_level', type=str, default='INFO', help='Logging level')
+    args = parser.parse_args(rawargs)
+    logging.basicConfig(format='%(levelname)s:%(asctime)s ||| %(message)s', level=args.log_level)
+
+    specs = read_manifest(args.manifest)
+    summary = batch_ummg(specs, workers=args.workers, checksum_cache_file=args.checksum_cache,
+                         verify_checksums=args.verify_checksums, validate_only=args.validate_only, fsync=args.fsync)
+
+    summary_file = args.summary if args.summary is not None else args.manifest + '.summary.json'
+    with open(summary_file, 'w') as fout:
+        fout.write(json.dumps(summary, indent=2))
+
+    for category, entry in sorted(summary['error_categories'].items(), key=lambda x: -x[1]['count']):
+        logging.error(f'{entry["count"]} granules: {category}')
+    if summary['invalid'] + summary['failed'] > 0:
+        raise RuntimeError(f'{summary["invalid"] + summary["failed"]} of {len(specs)} granules were not written - '
+                           f'see {summary_file} for details')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+Structural validation of UMM-G 1.6.5 granule metadata.
+
+The schema covers the required UMM-G fields and every field the EMIT UMMG builders write (types, required keys,
+enumerations, string lengths and coordinate ranges).  It is compiled once at import into nested validator
+functions, so validating a granule is a single cheap walk of its dictionary.
+"""
+
+import numbers
+import re
+
+UMMG_VERSION = '1.6.5'
+UMMG_URL = f'https://cdn.earthdata.nasa.gov/umm/granule/v{UMMG_VERSION}'
+
+_datetime_pattern = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})$')
+
+
+def _type_name(value):
+    return type(value).__name__
+
+
+def _string(min_length=1, max_length=None, enum=None, pattern=None):
+    def validate(value, path, errors):
+        if not isinstance(value, str):
+            errors.append(f'{path}: expected string, got {_type_name(value)}')
+            return
+        if len(value) < min_length or (max_length is not None and len(value) > max_length):
+            errors.append(f'{path}: length {len(value)} outside [{min_length}, {max_length}]')
+        if enum is not None and value not in enum:
+            errors.append(f'{path}: {value!r} not one of {sorted(enum)}')
+        if pattern is not None and pattern.match(value) is None:
+            errors.append(f'{path}: {value!r} is not a valid date-time')
+    return validate
+
+
+def _datetime():
+    return _string(pattern=_datetime_pattern)
+
+
+def _number(minimum=None, maximum=None, integer=False):
+    def validate(value, path, errors):
+        if isinstance(value, bool) or not isinstance(value, numbers.Real) or \
+                (integer and not isinstance(value, numbers.Integral)):
+            errors.append(f'{path}: expected {"integer" if integer else "number"}, got {_type_name(value)}')
+            return
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            errors.append(f'{path}: {value} outside [{minimum}, {maximum}]')
+    return validate
+
+
+def _array(items, min_items=0, max_items=None):
+    def validate(value, path, errors):
+        if not isinstance(value, list):
+            errors.append(f'{path}: expected array, got {_type_name(value)}')
+            return
+        if len(value) < min_items or (max_items is not None and len(value) > max_items):
+            errors.append(f'{path}: {len(value)} items outside [{min_items}, {max_items}]')
+        for _i, item in enumerate(value):
+            items(item, f'{path}[{_i}]', errors)
+    return validate
+
+
+def _object(properties, required=(), additional=False):
+    required = tuple(required)
+
+    def validate(value, path, errors):
+        if not isinstance(value, dict):
+            errors.append(f'{path}: expected object, got {_type_name(value)}')
+            return
+        for key in required:
+            if key not in value:
+                errors.append(f'{path}: missing required {key}')
+        for key, item in value.items():
+            if key in properties:
+                properties[key](item, f'{path}.{key}', errors)
+            elif not additional:
+                errors.append(f'{path}: unexpected property {key}')
+    return validate
+
+
+def _any_of(*validators):
+    def validate(value, path, errors):
+        attempts = []
+        for validator in validators:
+            attempt = []
+            validator(value, path, attempt)
+            if len(attempt) == 0:
+                return
+            attempts.append(attempt)
+        errors.extend(min(attempts, key=len))
+    return validate
+
+
+def _const(expected):
+    def validate(value, path, errors):
+        if value != expected:
+            errors.append(f'{path}: expected {expected!r}, got {value!r}')
+    return validate
+
+
+_point = _object({'Longitude': _number(-180, 180), 'Latitude': _number(-90, 90)},
+                 required=('Longitude', 'Latitude'))
+
+_geometry = _object({
+    'Points': _array(_point, min_items=1),
+    'BoundingRectangles': _array(_object({'WestBoundingCoordinate': _number(-180, 180),
+                                          'NorthBoundingCoordinate': _number(-90, 90),
+                                          'EastBoundingCoordinate': _number(-180, 180),
+                                          'SouthBoundingCoordinate': _number(-90, 90)},
+                                         required=('WestBoundingCoordinate', 'NorthBoundingCoordinate',
+                                                   'EastBoundingCoordinate', 'SouthBoundingCoordinate')),
+                                 min_items=1),
+    'GPolygons': _array(_object({'Boundary': _object({'Points': _array(_point, min_items=4)}, required=('Points',)),
+                                 'ExclusiveZone': _object({}, additional=True)},
+                                required=('Boundary',)), min_items=1),
+    'Lines': _array(_object({'Points': _array(_point, min_items=2)}, required=('Points',)), min_items=1),
+})
+
+_checksum = _object({'Value': _string(1, 128),
+                     'Algorithm': _string(enum={'Adler-32', 'BSD checksum', 'Fletcher-32', 'Fletcher-64', 'MD5',
+                                                'POSIX', 'SHA-1', 'SHA-2', 'SHA-256', 'SHA-384', 'SHA-512', 'SM3',
+                                                'SYSV'})},
+                    required=('Value', 'Algorithm'))
+
+_archive_info = _object({
+    'Name': _string(1, 1024),
+    'SizeInBytes': _number(0, integer=True),
+    'Size': _number(0),
+    'SizeUnit': _string(enum={'KB', 'MB', 'GB', 'TB', 'PB', 'NA'}),
+    'Format': _string(1, 80),
+    'FormatType': _string(enum={'Native', 'Supported'}),
+    'MimeType': _string(1, 80),
+    'Checksum': _checksum,
+    'Files': _array(_object({}, additional=True)),
+}, required=('Name',))
+
+_ummg_schema = _object({
+    'GranuleUR': _string(1, 250),
+    'ProviderDates': _array(_object({'Date': _datetime(),
+                                     'Type': _string(enum={'Create', 'Insert', 'Update', 'Delete'})},
+                                    required=('Date', 'Type')), min_items=1, max_items=4),
+    'CollectionReference': _any_of(_object({'ShortName': _string(1, 85), 'Version': _string(1, 80)},
+                                           required=('ShortName', 'Version')),
+                                   _object({'EntryTitle': _string(1, 1030)}, required=('EntryTitle',))),
+    'AccessConstraints': _object({'Description': _string(1, 4000), 'Value': _number()}, required=('Value',)),
+    'DataGranule': _object({
+        'ArchiveAndDistributionInformation': _array(_archive_info, min_items=1),
+        'ReprocessingPlanned': _string(1, 80),
+        'ReprocessingActual': _string(1, 80),
+        'DayNightFlag': _string(enum={'Day', 'Night', 'Both', 'Unspecified'}),
+        'ProductionDateTime': _datetime(),
+        'Identifiers': _array(_object({}, additional=True), min_items=1),
+    }, required=('DayNightFlag', 'ProductionDateTime')),
+    'PGEVersionClass': _object({'PGEName': _string(1, 1024), 'PGEVersion': _string(1, 50)},
+                               required=('PGEVersion',)),
+    'TemporalExtent': _any_of(_object({'RangeDateTime': _object({'BeginningDateTime': _datetime(),
+                                                                 'EndingDateTime': _datetime()},
+                                                                required=('BeginningDateTime',))},
+                                      required=('RangeDateTime',)),
+                              _object({'SingleDateTime': _datetime()}, required=('SingleDateTime',))),
+    'SpatialExtent': _object({
+        'GranuleLocalities': _array(_string(1, 1024), min_items=1),
+        'HorizontalSpatialDomain': _object({'Geometry': _geometry, 'ZoneIdentifier': _string(1, 80),
+                                            'Orbit': _object({}, additional=True),
+                                            'Track': _object({}, additional=True)}, required=()),
+        'VerticalSpatialDomains': _array(_object({}, additional=True), min_items=1),
+    }),
+    'OrbitCalculatedSpatialDomains': _array(_object({}, additional=True), min_items=1),
+    'MeasuredParameters': _array(_object({}, additional=True), min_items=1),
+    'Platforms': _array(_object({'ShortName': _string(1, 80),
+                                 'Instruments': _array(_object({'ShortName': _string(1, 80)}, required=('ShortName',),
+                                                               additional=True), min_items=1)},
+                                required=('ShortName',)), min_items=1),
+    'Projects': _array(_object({}, additional=True), min_items=1),
+    'AdditionalAttributes': _array(_object({'Name': _string(1, 85), 'Values': _array(_string(1, 500), min_items=1)},
+                                           required=('Name', 'Values')), min_items=1),
+    'InputGranules': _array(_string(1, 500), min_items=1),
+    'TilingIdentificationSystem': _object({}, additional=True),
+    'CloudCover': _number(),
+    'RelatedUrls': _array(_object({'URL': _string(1, 1024), 'Type': _string(1, 80), 'Subtype': _string(1, 80),
+                                   'Description': _string(1, 4000), 'Format': _string(1, 80),
+                                   'MimeType': _string(1, 80), 'Size': _number(0), 'SizeUnit': _string(1, 2)},
+                                  required=('URL', 'Type')), min_items=1),
+    'NativeProjectionNames': _array(_string(1, 80), min_items=1),
+    'GridMappingNames': _array(_string(1, 1024), min_items=1),
+    'MetadataSpecification': _object({'URL': _const(UMMG_URL), 'Name': _const('UMM-G'),
+                                      'Version': _const(UMMG_VERSION)}, required=('URL', 'Name', 'Version')),
+}, required=('GranuleUR', 'ProviderDates', 'CollectionReference', 'MetadataSpecification'))
+
+
+def validate_ummg(ummg: dict):
+    """
+    Validate a UMMG dictionary against the UMM-G 1.6.5 structural schema
+    Args:
+        ummg: UMMG to check
+
+    Returns:
+        list: error strings (with JSON-path style locations), empty if valid
+    """
+    errors = []
+    _ummg_schema(ummg, 'ummg', errors)
+    return errors